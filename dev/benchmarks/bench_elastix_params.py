@@ -0,0 +1,45 @@
+"""
+Benchmark the construction of elastix parameter objects.
+
+Measures the time of the first itk.ParameterObject.New() in a process, 
+which loads itk, and then the time per parameter object when it is built 
+from scratch and when it is copied from the cache in 
+mdreg.elastix._params_obj.
+
+cd to mdreg top folder
+>>> python dev/benchmarks/bench_elastix_params.py
+"""
+
+import time
+
+import itk
+
+from mdreg import elastix
+
+
+if __name__ == '__main__':
+
+    n = 1000
+
+    start = time.time()
+    itk.ParameterObject.New()
+    print(f'First itk.ParameterObject.New(): {time.time()-start:.2f} sec')
+
+    for method, params in [('bspline', elastix.BSPLINE), ('rigid', elastix.RIGID)]:
+
+        elastix.set_cache_size(0)
+        start = time.time()
+        for _ in range(n):
+            elastix._params_obj(method, **params)
+        build = (time.time() - start) / n
+
+        elastix.set_cache_size(32)
+        elastix._params_obj(method, **params)
+        start = time.time()
+        for _ in range(n):
+            elastix._params_obj(method, **params)
+        hit = (time.time() - start) / n
+
+        print(f'{method}: build {1e6*build:.1f} us, cache hit {1e6*hit:.1f} us')
+
+    elastix.clear_cache()
@@ -0,0 +1,57 @@
+"""
+Benchmark repeated calls of elastix.coreg_series with a pool of processes.
+
+Coregisters a slice of the MOLLI data a few times in a row, as in the 
+iterations of mdreg.fit, with a pool of threads, with executor = 
+'processes', and with a ProcessPoolExecutor started by the caller. The 
+first call with processes includes the start of the workers, which each 
+load itk; later calls reuse the same workers.
+
+cd to mdreg top folder
+>>> python dev/benchmarks/bench_elastix_pool.py
+"""
+
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import mdreg
+from mdreg import elastix
+
+
+def run(moving, fixed, ncalls=3, **kwargs):
+    times = []
+    for _ in range(ncalls):
+        start = time.time()
+        coreg, _ = elastix.coreg_series(
+            moving, fixed, parallel=True, **kwargs)
+        times.append(time.time() - start)
+    return coreg, times
+
+
+if __name__ == '__main__':
+
+    data = mdreg.fetch('MOLLI_small')
+    moving = data['array'][:,:,0,:].astype(np.float32)
+    fixed = np.repeat(np.mean(moving, axis=-1, keepdims=True), 
+                      moving.shape[-1], axis=-1)
+    n = min(4, os.cpu_count())
+    print(f'MOLLI slice {moving.shape} - {n} workers')
+    print('executor          call times (sec)')
+
+    ref, times = run(moving, fixed, executor='threads', n_workers=n)
+    print(f'{"threads":<17} ' + ' '.join(f'{t:>6.2f}' for t in times))
+
+    coreg, times = run(moving, fixed, executor='processes', n_workers=n)
+    print(f'{"processes":<17} ' + ' '.join(f'{t:>6.2f}' for t in times))
+    assert np.array_equal(coreg, ref)
+    elastix.shutdown_pool()
+
+    with ProcessPoolExecutor(
+            n, mp_context=multiprocessing.get_context('spawn')) as pool:
+        coreg, times = run(moving, fixed, executor=pool)
+    print(f'{"caller pool":<17} ' + ' '.join(f'{t:>6.2f}' for t in times))
+    assert np.array_equal(coreg, ref)
@@ -0,0 +1,41 @@
+"""
+Benchmark elastix registrations that start from a previous transform.
+
+Coregisters a slice of the MOLLI data to a fixed series, then registers it 
+again a few times, each time starting from the transforms of the previous 
+run. Reports the calculation time, the number of parameter maps in the 
+transforms, and checks that applying the returned transforms with 
+transform_series reproduces the coregistered images.
+
+cd to mdreg top folder
+>>> python dev/benchmarks/bench_elastix_warm_start.py
+"""
+
+import time
+
+import numpy as np
+
+import mdreg
+from mdreg import elastix
+
+
+if __name__ == '__main__':
+
+    data = mdreg.fetch('MOLLI_small')
+    moving = data['array'][:,:,0,:].astype(np.float32)
+    fixed = np.repeat(np.mean(moving, axis=-1, keepdims=True), 
+                      moving.shape[-1], axis=-1)
+
+    print(f'MOLLI slice {moving.shape}')
+    print('run   time (sec)   maps   max |transform_series - coreg|')
+    transfo = None
+    for run in range(4):
+        start = time.time()
+        coreg, transfo = elastix.coreg_series(
+            moving, fixed, init=transfo, **elastix.BSPLINE)
+        t = time.time() - start
+        deform = elastix.transform_series(moving, transfo)
+        err = np.max(np.abs(deform - coreg))
+        nmaps = transfo[0].GetNumberOfParameterMaps()
+        print(f'{run:>3} {t:>12.2f} {nmaps:>6} {err:>34.2e}')
+        assert np.allclose(deform, coreg, atol=1e-4*np.max(np.abs(coreg)))
@@ -0,0 +1,56 @@
+"""
+Benchmark the scaling of parallel pixel fitting with the number of cores.
+
+Reports the wall time of mdreg.fit_pixels with scipy.curve_fit on the 
+MOLLI data, for each executor and an increasing number of workers, and 
+the speedup relative to a serial computation.
+
+cd to mdreg top folder
+>>> python dev/benchmarks/bench_executor.py
+"""
+
+import os
+import time
+
+import numpy as np
+
+import mdreg
+from mdreg import fit_models, pixel_models
+
+
+def run(signal, TI, **kwargs):
+    start = time.time()
+    mdreg.fit_pixels(
+        signal,
+        model=pixel_models.abs_exp_recovery_2p,
+        xdata=TI,
+        func_init=pixel_models.abs_exp_recovery_2p_init,
+        p0=[1, 1.3],
+        bounds=([0, 0], [np.inf, np.inf]),
+        progress_bar=False,
+        **kwargs,
+    )
+    return time.time() - start
+
+
+if __name__ == '__main__':
+
+    data = mdreg.fetch('MOLLI_small')
+    signal = data['array'][:,:,0,:]
+    TI = np.array(data['TI'])/1000
+
+    executors = ['threads', 'processes']
+    if fit_models.distributed_installed:
+        executors.append('distributed')
+
+    ncpu = os.cpu_count()
+    workers = [n for n in [1, 2, 4, 8, 16, 32, 64] if n < ncpu] + [ncpu]
+
+    serial = run(signal, TI, parallel=False)
+    print(f'MOLLI slice {signal.shape} - {ncpu} CPUs')
+    print(f'serial: {serial:.2f} sec')
+    print('executor      workers   time (sec)   speedup')
+    for executor in executors:
+        for n in workers:
+            t = run(signal, TI, parallel=True, executor=executor, n_workers=n)
+            print(f'{executor:<13} {n:>7} {t:>12.2f} {serial/t:>9.2f}')
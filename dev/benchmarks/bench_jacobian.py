@@ -0,0 +1,78 @@
+"""
+Benchmark analytical versus numerical Jacobians in pixel-based fitting.
+
+Reports the number of model evaluations and the wall time of
+mdreg.fit_pixels on the MOLLI and VFA datasets, with the Jacobian either
+approximated by finite differences (jac=None) or taken from the registry
+in mdreg.pixel_models.
+
+cd to mdreg top folder
+>>> python dev/benchmarks/bench_jacobian.py
+"""
+
+import time
+
+import numpy as np
+
+import mdreg
+from mdreg import pixel_models
+
+
+def counted(model, counter):
+    def func(*args):
+        counter[0] += 1
+        return model(*args)
+    return func
+
+
+def run(name, signal, model, xdata, func_init, p0, bounds, solver):
+
+    print(f'\n{name} - {signal.shape} - solver={solver}')
+    for label, jac in [
+            ('numerical', None), 
+            ('analytical', pixel_models.get_jac(model)),
+        ]:
+        nfev = [0]
+        start = time.time()
+        fit, pars = mdreg.fit_pixels(
+            signal,
+            model=counted(model, nfev),
+            xdata=xdata,
+            func_init=func_init,
+            p0=p0,
+            bounds=bounds,
+            parallel=False,
+            progress_bar=False,
+            solver=solver,
+            jac=jac,
+        )
+        t = time.time() - start
+        print(f'{label:>12}: {nfev[0]:>9} model evaluations - {t:.2f} sec')
+
+
+if __name__ == '__main__':
+
+    molli = mdreg.fetch('MOLLI_small')
+    vfa = mdreg.fetch('VFA_small')
+
+    for solver in ['curve_fit', 'batched']:
+        run(
+            'MOLLI', 
+            molli['array'][:,:,0,:], 
+            pixel_models.abs_exp_recovery_2p, 
+            np.array(molli['TI'])/1000, 
+            pixel_models.abs_exp_recovery_2p_init, 
+            [1, 1.3], 
+            ([0, 0], [np.inf, np.inf]),
+            solver,
+        )
+        run(
+            'VFA', 
+            vfa['array'], 
+            pixel_models.spgr_vfa, 
+            vfa['FA'], 
+            pixel_models.spgr_vfa_init, 
+            [1, 0.5], 
+            ([0, 0], [np.inf, 1]),
+            solver,
+        )
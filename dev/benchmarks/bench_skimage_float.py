@@ -0,0 +1,64 @@
+"""
+Benchmark the float32 and the int16 (quantize=True) optical flow paths.
+
+Each image of the MOLLI and VFA series is deformed with a known smooth 
+deformation field and then coregistered back to the original with 
+mdreg.skimage.coreg. Reports the calculation time, the error on the 
+recovered image and the error on the recovered deformation field.
+
+cd to mdreg top folder
+>>> python dev/benchmarks/bench_skimage_float.py
+"""
+
+import time
+
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+import mdreg
+from mdreg import skimage
+
+
+def deformation(shape, amplitude=2.0, smooth=None, seed=0):
+    # Smooth random deformation field with maximum displacement amplitude
+    rng = np.random.default_rng(seed)
+    if smooth is None:
+        smooth = min(shape)/4
+    defo = np.stack([
+        gaussian_filter(rng.normal(size=shape), smooth) 
+        for _ in range(len(shape))
+    ], axis=-1)
+    return amplitude*defo/np.amax(np.abs(defo))
+
+
+def run(name, array):
+
+    print(f'\n{name} - {array.shape}')
+    print('quantize    time (sec)    image error (%)    defo error (voxels)')
+    for quantize in [True, False]:
+        seconds, img_err, defo_err = 0, [], []
+        for t in range(array.shape[-1]):
+            fixed = array[...,t]
+            defo = deformation(fixed.shape, seed=t)
+            moving = skimage.transform(fixed, defo)
+            start = time.time()
+            coreg, defo_est = skimage.coreg(moving, fixed, quantize=quantize)
+            seconds += time.time() - start
+            img_err.append(
+                100*np.linalg.norm(coreg-fixed)/np.linalg.norm(fixed)
+            )
+            # The estimated deformation maps the fixed onto the moving grid
+            defo_err.append(
+                np.sqrt(np.mean(np.sum((defo_est + defo)**2, axis=-1)))
+            )
+        print(f'{str(quantize):<11} {seconds:>10.2f} {np.mean(img_err):>18.3f}'
+              f' {np.mean(defo_err):>22.3f}')
+
+
+if __name__ == '__main__':
+
+    data = mdreg.fetch('MOLLI_small')
+    run('MOLLI_small', data['array'][:,:,0,:].astype(np.float32))
+
+    data = mdreg.fetch('VFA_small')
+    run('VFA_small', data['array'][:,:,0,:].astype(np.float32))
@@ -0,0 +1,77 @@
+"""
+Benchmark warm starts of the model fit across iterations of mdreg.fit.
+
+Reports the number of model evaluations and the calculation time of the
+model fit in each iteration of mdreg.fit on a slice of the MOLLI data,
+with and without warm_start.
+
+cd to mdreg top folder
+>>> python dev/benchmarks/bench_warm_start.py
+"""
+
+import time
+
+import numpy as np
+
+import mdreg
+from mdreg import fit_models, pixel_models
+
+
+def counted(model, counter):
+    def func(*args):
+        counter[0] += 1
+        return model(*args)
+    return func
+
+
+def run(array, TI, warm_start, maxit=5):
+
+    nfev = [0]
+    stats = []
+    fit_pixels = fit_models.fit_pixels
+
+    def fit_pixels_timed(*args, **kwargs):
+        n, start = nfev[0], time.time()
+        vals = fit_pixels(*args, **kwargs)
+        stats.append((nfev[0] - n, time.time() - start))
+        return vals
+
+    fit_models.fit_pixels = fit_pixels_timed
+    try:
+        mdreg.fit(
+            array,
+            fit_pixels={
+                'model': counted(pixel_models.abs_exp_recovery_2p, nfev),
+                'jac': pixel_models.abs_exp_recovery_2p_jac,
+                'xdata': TI,
+                'func_init': pixel_models.abs_exp_recovery_2p_init,
+                'p0': [1, 1.3],
+                'bounds': ([0, 0], [np.inf, np.inf]),
+                'parallel': False,
+                'progress_bar': False,
+            },
+            maxit=maxit,
+            tol=0,
+            warm_start=warm_start,
+        )
+    finally:
+        fit_models.fit_pixels = fit_pixels
+    return stats
+
+
+if __name__ == '__main__':
+
+    data = mdreg.fetch('MOLLI_small')
+    array = data['array'][:,:,0,:]
+    TI = np.array(data['TI'])/1000
+
+    cold = run(array, TI, False)
+    warm = run(array, TI, True)
+
+    print(f'MOLLI slice {array.shape}')
+    print('iteration    cold start (nfev, sec)    warm start (nfev, sec)')
+    for it, (c, w) in enumerate(zip(cold, warm)):
+        print(f'{it+1:>9} {c[0]:>15} {c[1]:>8.2f} {w[0]:>17} {w[1]:>8.2f}')
+    print(f'{"total":>9} {sum(c[0] for c in cold):>15} '
+          f'{sum(c[1] for c in cold):>8.2f} {sum(w[0] for w in warm):>17} '
+          f'{sum(w[1] for w in warm):>8.2f}')
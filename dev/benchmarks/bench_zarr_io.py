@@ -0,0 +1,90 @@
+"""
+Benchmark the zarr options of mdreg.io.set_zarr_options.
+
+The MOLLI series is saved as a zarr array on disk with one chunk per
+slice. For each combination of output data type, compressor and chunk
+layout, the output arrays are allocated and then written in the two access
+patterns used by mdreg: one slice of fitted signals and parameters at a
+time (pixel fitting) and one frame of coregistered images and deformation
+fields at a time (registration). Reports the time of each step, the write
+throughput and the size of the results on disk.
+
+cd to mdreg top folder
+>>> python dev/benchmarks/bench_zarr_io.py
+"""
+
+import os
+import time
+import tempfile
+
+import numpy as np
+import zarr
+
+import mdreg
+from mdreg import io
+
+
+def disk_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        size += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return size
+
+
+def run(moving, dtype, compressor, layout):
+
+    io.set_zarr_options(dtype=dtype, compressor=compressor, layout=layout)
+    with tempfile.TemporaryDirectory() as path:
+
+        store = os.path.join(path, 'moving.zarr')
+        zmoving = zarr.open_array(
+            store, mode='w', shape=moving.shape,
+            chunks=moving.shape[:2] + (1, moving.shape[3]), dtype=moving.dtype,
+        )
+        zmoving[:] = moving
+
+        start = time.time()
+        fit, pars = io._fit_models_init(zmoving, path, 2)
+        coreg = io._copy(zmoving, path, 'coreg')
+        defo = io._defo(zmoving, path)
+        t_alloc = time.time() - start
+
+        # Pixel fitting writes one slice at a time
+        start = time.time()
+        for z in range(moving.shape[2]):
+            fit[:,:,z,:] = moving[:,:,z,:]
+            pars[:,:,z,:] = moving[:,:,z,:2]
+        t_fit = time.time() - start
+
+        # Registration writes one frame at a time
+        start = time.time()
+        for t in range(moving.shape[3]):
+            coreg[...,t] = moving[...,t]
+            defo[...,t,:] = moving[...,t,None]
+        t_coreg = time.time() - start
+
+        nbytes = (fit.nbytes + pars.nbytes) / 1e6
+        mb_fit = nbytes / t_fit
+        mb_coreg = (coreg.nbytes + defo.nbytes) / 1e6 / t_coreg
+        size = disk_size(path) / 1e6
+
+    print(f'{str(dtype):<9} {str(compressor):<9} {str(layout):<7}'
+          f' {t_alloc:>9.3f} {t_fit:>9.3f} {mb_fit:>9.1f}'
+          f' {t_coreg:>9.3f} {mb_coreg:>9.1f} {size:>9.1f}')
+
+
+if __name__ == '__main__':
+
+    data = mdreg.fetch('MOLLI')
+    moving = data['array'].astype(np.float32)
+
+    # Repeat the slices to get a larger series
+    moving = np.tile(moving, (1, 1, 8, 1))
+    print(f'MOLLI - {moving.shape}')
+    print('dtype     compr     layout  alloc (s)   fit (s)  fit MB/s'
+          ' coreg (s) coreg MB/s disk (MB)')
+    for layout in [None, 'auto']:
+        for compressor in ['default', 'lz4', None]:
+            for dtype in [None, 'float32', 'float16']:
+                run(moving, dtype, compressor, layout)
+    io.set_zarr_options()
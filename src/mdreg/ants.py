@@ -58,6 +58,9 @@ def coreg_series(
         path=None, 
         name='coreg',
         return_transfo=True,
+        in_memory=False,
+        frames=None,
+        callback=None,
         **kwargs,
     ):
     """
@@ -85,6 +88,21 @@ def coreg_series(
         to files on disk. If this is set to False, only the coregistered 
         image is returned and the transformations are deleted on disk.
         Defaults to True.
+    in_memory : bool
+        If True, the transformations are read into ants transform objects 
+        as soon as they are computed, and the files written by ants are 
+        deleted. Defaults to False.
+    frames : list, optional
+        Indices of the time points to coregister. The other time points are 
+        not coregistered: their coregistered image is a copy of the moving 
+        image. Defaults to None (coregister all time points).
+    callback : callable, optional
+        Function called as callback(t, coreg_t, defo_t) with the 
+        coregistered image coreg_t and the deformation field defo_t at time 
+        point t, before they are written to the output arrays. defo_t is 
+        None if the deformation field is not computed. With 
+        parallel = True, it may be called from several threads at once. 
+        Defaults to None.
     kwargs : dict
         Any keyword argument accepted by 
         `ants.registration <https://antspy.readthedocs.io/en/latest/registration.html>`_. 
@@ -96,7 +114,8 @@ def coreg_series(
     cor : numpy.ndarray | zarr.Array
         Coregistered series with the same dimensions as the moving image. 
     transfo : list
-        List of paths to files containing the transformation parameters.
+        List of paths to files containing the transformation parameters, 
+        or lists of ants transform objects if in_memory = True.
     """
 
     if not_installed:
@@ -111,47 +130,59 @@ def coreg_series(
     
     coreg = io._copy(moving, path, name)
     transfo = np.empty(moving.shape[-1], dtype=object)
+    if frames is None:
+        frames = range(moving.shape[-1])
 
     if parallel:
         tasks = []
-        for t in range(moving.shape[-1]): 
+        for t in frames: 
             task_t = dask.delayed(_coreg_t)(
-                t, moving, fixed, coreg, transfo, **kwargs,
+                t, moving, fixed, coreg, transfo, callback, 
+                return_transfo, in_memory, **kwargs,
             )
             tasks.append(task_t)
         dask.compute(*tasks)
     else:
         for t in tqdm(
-                range(moving.shape[-1]), 
+                frames, 
                 desc='Coregistering series', 
                 disable=not progress_bar, 
             ): 
-            _coreg_t(t, moving, fixed, coreg, transfo, **kwargs)
+            _coreg_t(
+                t, moving, fixed, coreg, transfo, callback, 
+                return_transfo, in_memory, **kwargs,
+            )
 
     # Create return values
-    transfo = list(transfo)
     if not return_transfo:
-        for transfo_t in transfo:
-            if isinstance(transfo_t, list):
-                [os.remove(t) for t in transfo_t]
-            else:
-                os.remove(transfo_t)
         return coreg
     else:
-        return coreg, transfo
+        return coreg, list(transfo)
        
 
 
-def _coreg_t(t, moving, fixed, deformed, transfo, **kwargs):
-    deformed[...,t], transfo[t] = coreg(
-        moving[...,t], fixed[...,t], **kwargs,
-    )
+def _coreg_t(t, moving, fixed, deformed, transfo, callback=None, 
+             return_transfo=True, in_memory=False, **kwargs):
+    # Transformations that are not returned are deleted straight away
+    if return_transfo:
+        deformed_t, transfo[t] = coreg(
+            moving[...,t], fixed[...,t], in_memory=in_memory, **kwargs,
+        )
+    else:
+        deformed_t = coreg(
+            moving[...,t], fixed[...,t], return_transfo=False, **kwargs,
+        )
+    if callback is not None:
+        callback(t, deformed_t, None)
+    deformed[...,t] = deformed_t
 
 def transform_series(
         moving, 
         transfo, 
         path=None, 
         name='deform',
+        parallel=True,
+        interpolator='linear',
     ):
     """
     Transforms a series of images using a transformation produced by 
@@ -162,14 +193,20 @@ def transform_series(
     moving : numpy.ndarray | zarr.Array
         The moving image or volume, with dimensions (x,y,t) or (x,y,z,t).  
     transfo : list
-        List of itk.elastixParameterObject with one transform per image 
-        in the series.
+        List with one transformation per image in the series, as returned 
+        by `mdreg.ants.coreg_series()`. Transformations that are held in 
+        memory are applied without writing to disk.
     path : str, optional
         Path on disk where to save the results. If no path is provided, the 
         results are not saved to disk. Defaults to None.
     name : str, optional
         For data that are saved on disk, provide an optional filename. This 
         argument is ignored if no path is provided.
+    parallel : bool
+        Set to True to transform the images in parallel. Defaults to True.
+    interpolator : str
+        Type of interpolation to use. For options see the 
+        `ants documentation <https://antspy.readthedocs.io/en/latest/registration.html>`_ 
 
     Returns
     -------
@@ -183,15 +220,48 @@ def transform_series(
         )
     
     deform = io._copy(moving, path, name)
-    for t, transfo_t in enumerate(transfo):
-        deform[...,t] = transform(moving[...,t], transfo_t)
+
+    # The geometry is the same for all images so the reference is 
+    # only created once.
+    reference = ants.from_numpy(np.asarray(moving[...,0], dtype=np.float32))
+
+    # Time points without transformation are left untransformed
+    frames = [t for t, transfo_t in enumerate(transfo) if transfo_t is not None]
+    if parallel:
+        tasks = []
+        for t in frames:
+            task_t = dask.delayed(_transform_t)(
+                t, moving, transfo[t], reference, deform, interpolator,
+            )
+            tasks.append(task_t)
+        dask.compute(*tasks)
+    else:
+        for t in frames:
+            _transform_t(
+                t, moving, transfo[t], reference, deform, interpolator,
+            )
     return deform
 
 
+def _transform_t(t, moving, transfo_t, reference, deform, interpolator):
+    # Transformation files are read once and applied in memory
+    if isinstance(transfo_t, list) and not isinstance(transfo_t[0], str):
+        transforms = transfo_t
+    else:
+        transforms = _read_transforms(transfo_t)
+    composite = ants.compose_ants_transforms(transforms)
+    moving_t = ants.from_numpy(np.asarray(moving[...,t], dtype=np.float32))
+    warped = composite.apply_to_image(
+        moving_t, reference=reference, interpolation=interpolator,
+    )
+    deform[...,t] = warped.numpy()
+
+
 def coreg(
         moving: np.ndarray, 
         fixed: np.ndarray, 
         return_transfo = True,
+        in_memory = False,
         **kwargs,
     ):
     """
@@ -205,6 +275,9 @@ def coreg(
             to files on disk. If this is set to False, only the coregistered 
             image is returned and the transformations are deleted on disk.
             Defaults to True.
+        in_memory (bool): If True, the transformations are read into ants 
+            transform objects and the files written by ants are deleted. 
+            Defaults to False.
         kwargs: Any keyword argument accepted by 
           `ants.registration <https://antspy.readthedocs.io/en/latest/registration.html>`_. 
           Note that array arguments need to be provided as numpy arrays rather 
@@ -215,7 +288,8 @@ def coreg(
             The registered moving image.
         transfo : str | list
             path or paths of parameter files encoding the transformation from moving 
-            to coregistered image 
+            to coregistered image, or list of ants transform objects if 
+            in_memory = True. 
     """
 
     if not_installed:
@@ -241,13 +315,40 @@ def coreg(
     # Create return values
     transfo = registration['fwdtransforms']
     if not return_transfo:
-        if isinstance(transfo, list):
-            [os.remove(t) for t in transfo]
-        else:
-            os.remove(transfo)
+        _remove_files(registration)
         return coreg
-    else:
-        return coreg, transfo
+    if in_memory:
+        transfo = _read_transforms(transfo)
+        _remove_files(registration)
+    return coreg, transfo
+
+
+def _read_transforms(transfo):
+    if isinstance(transfo, str):
+        transfo = [transfo]
+    transforms = []
+    for file in transfo:
+        if file.endswith('.mat'):
+            # Affine transformations
+            transforms.append(ants.read_transform(file))
+        else:
+            # Deformation fields
+            field = ants.image_read(file)
+            transforms.append(ants.transform_from_displacement_field(field))
+    return transforms
+
+
+def _remove_files(registration):
+    # Remove forward and inverse transformations written by ants
+    files = []
+    for key in ['fwdtransforms', 'invtransforms']:
+        transfo = registration.get(key, [])
+        if isinstance(transfo, str):
+            transfo = [transfo]
+        files += [f for f in transfo if f not in files]
+    for file in files:
+        if os.path.exists(file):
+            os.remove(file)
 
 
 def transform(moving, transfo, interpolator='linear'):
@@ -260,7 +361,8 @@ def transform(moving, transfo, interpolator='linear'):
             The input 2D or 3D image array.
         transfo : str | list
             path or paths to parameter files encoding the transformation 
-            from moving to coregistered image 
+            from moving to coregistered image, or list of ants transform 
+            objects. 
         interpolator : str
             Type of interpolation to use. For options see the 
             `ants documentation <https://antspy.readthedocs.io/en/latest/registration.html>`_ 
@@ -276,7 +378,15 @@ def transform(moving, transfo, interpolator='linear'):
     
     moving = ants.from_numpy(moving)
 
-    # Apply transformation
+    # Apply transformation in memory
+    if isinstance(transfo, list) and not isinstance(transfo[0], str):
+        composite = ants.compose_ants_transforms(transfo)
+        warped_image = composite.apply_to_image(
+            moving, reference=moving, interpolation=interpolator,
+        )
+        return warped_image.numpy()
+
+    # Apply transformation from files
     warped_image = ants.apply_transforms(
         fixed=moving, 
         moving=moving, 
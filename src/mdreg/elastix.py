@@ -1,6 +1,11 @@
 import __main__
-import os
 import warnings
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
 from typing import Tuple, Union
 
 from tqdm import tqdm
@@ -18,6 +23,16 @@ else:
     not_installed = False
 
 
+# Process-wide cache of elastix parameter objects
+_PARAMS_CACHE = OrderedDict()
+_PARAMS_CACHE_SIZE = 32
+_PARAMS_CACHE_LOCK = threading.Lock()
+
+# Process pool kept alive across calls to coreg_series
+_POOL = None
+_POOL_WORKERS = None
+_POOL_LOCK = threading.Lock()
+
 
 def defaults(method='bspline'):
     """The default elastix parameters
@@ -50,6 +65,13 @@ def coreg_series(
         return_deformation=False,
         spacing=1.0, 
         method='bspline', 
+        init=None,
+        init_params=None,
+        frames=None,
+        callback=None,
+        executor='threads',
+        n_workers=None,
+        threads_per_worker=None,
         **params,
     ):
     
@@ -83,6 +105,51 @@ def coreg_series(
     method : str
         Deformation method to use. Options are 'bspline', 'affine', 'rigid' 
         or 'translation'. Default is 'bspline'.
+    init : list, optional
+        List of itk.elastixParameterObject with one initial transform per 
+        image in the series, for instance the transfo returned by a 
+        previous call. The registration of each image then starts from 
+        its initial transform, and the returned transform contains the 
+        parameter maps of the initial transform followed by those of the 
+        registration, so that `transform_series` reproduces the 
+        coregistered images. Entries that are None are registered from 
+        the identity. Defaults to None.
+    init_params : dict, optional
+        Elastix parameters that overrule *params* for images that have an 
+        initial transform. Since these only need a small correction, the 
+        default (mdreg.elastix.INIT_PARAMS) uses 2 resolutions with at 
+        most 250 iterations each. 
+    frames : list, optional
+        Indices of the time points to coregister. The other time points are 
+        not coregistered: their coregistered image is a copy of the moving 
+        image. Defaults to None (coregister all time points).
+    callback : callable, optional
+        Function called as callback(t, coreg_t, defo_t) with the 
+        coregistered image coreg_t and the deformation field defo_t at time 
+        point t, before they are written to the output arrays. defo_t is 
+        None if the deformation field is not computed. With 
+        parallel = True, it may be called from several threads at once. 
+        Defaults to None.
+    executor : str | concurrent.futures.ProcessPoolExecutor
+        Workers used when parallel = True. With 'threads' (default) the 
+        images are coregistered in a pool of threads that share the same 
+        parameter object. With 'processes' they are coregistered in a pool 
+        of processes that each build their own parameter object once, and 
+        read the images from shared memory. Starting the processes is slow 
+        as each of them loads itk, so the pool is kept alive for later 
+        calls with the same *n_workers* until 
+        mdreg.elastix.shutdown_pool() is called. Alternatively a running 
+        ProcessPoolExecutor can be provided, which is not shut down 
+        afterwards. Since itk is not fork-safe, it must use the 'spawn' 
+        start method. 
+    n_workers : int, optional
+        Number of workers used when parallel = True. The default is the 
+        number of CPUs.
+    threads_per_worker : int, optional
+        Number of threads used by elastix for each registration. With 
+        'processes', setting this to the number of CPUs divided by 
+        *n_workers* avoids oversubscribing the machine. The default lets 
+        elastix decide.
     params : dict
         Use keyword arguments to overrule any of the default parameters in 
         the elastix template for the chosen method. The default parameters 
@@ -115,46 +182,224 @@ def coreg_series(
     else:
         defo = None
 
-    # This is a very slow step so needs to be done outside the loop
+    if frames is None:
+        frames = range(moving.shape[-1])
+
+    if not isinstance(executor, ProcessPoolExecutor):
+        if executor not in ['threads', 'processes']:
+            raise ValueError(
+                f"Executor {executor} is not available. Options are "
+                "'threads', 'processes' or a running ProcessPoolExecutor."
+            )
+
+    if init is None:
+        init_params = None
+    elif init_params is None:
+        init_params = INIT_PARAMS
+
+    if parallel and executor != 'threads':
+        if progress_bar:
+            print('Coregistering..')
+        # The workers build their own parameter objects
+        _coreg_processes(
+            moving, fixed, frames, spacing, method, params, init, 
+            init_params, coreg, transfo, defo, callback, executor, 
+            n_workers, threads_per_worker,
+        )
+        if return_deformation:
+            return coreg, transfo, defo
+        else:
+            return coreg, transfo
+
+    # Built once outside the loop. The first call in a process is slow 
+    # as it loads itk.
     if progress_bar:
         print('Building elastix parameter object..')
     p_obj = _params_obj(method, **params) 
+    if init is None:
+        p_obj_init = None
+    else:
+        p_obj_init = _params_obj(method, **{**params, **init_params})
 
     if parallel:
         if progress_bar:
             print('Coregistering..')
         tasks = []
-        for t in range(moving.shape[-1]): 
+        for t in frames: 
             task_t = dask.delayed(_coreg_t)(
-                t, moving, fixed, spacing, p_obj, coreg, transfo, defo
+                t, moving, fixed, spacing, p_obj, coreg, transfo, defo, 
+                callback, init, p_obj_init, threads_per_worker,
             )
             tasks.append(task_t)
-        dask.compute(*tasks)
+        dask.compute(*tasks, num_workers=n_workers)
     else:
         for t in tqdm(
-                range(moving.shape[-1]), 
+                frames, 
                 desc='Coregistering..', 
                 disable= not progress_bar,
             ): 
             _coreg_t(
-                t, moving, fixed, spacing, p_obj, coreg, transfo, defo
+                t, moving, fixed, spacing, p_obj, coreg, transfo, defo, 
+                callback, init, p_obj_init, threads_per_worker,
             )
-    _cleanup(**params)
     if return_deformation:
         return coreg, transfo, defo
     else:
         return coreg, transfo
      
 
-def _coreg_t(t, moving, fixed, spacing, p_obj, coreg, transfo, defo):
+def _coreg_t(t, moving, fixed, spacing, p_obj, coreg, transfo, defo, 
+             callback=None, init=None, p_obj_init=None, threads=None):
+    init_t = None if init is None else init[t]
+    if init_t is not None:
+        p_obj = p_obj_init
     if defo is None:
-        coreg[...,t], transfo[t] = _coreg(
-            moving[...,t], fixed[...,t], spacing, p_obj, False
+        coreg_t, transfo[t] = _coreg(
+            moving[...,t], fixed[...,t], spacing, p_obj, False, init_t, 
+            threads,
         )
+        defo_t = None
     else:
-        coreg[...,t], transfo[t], defo[...,t,:] = _coreg(
-            moving[...,t], fixed[...,t], spacing, p_obj, True
+        coreg_t, transfo[t], defo_t = _coreg(
+            moving[...,t], fixed[...,t], spacing, p_obj, True, init_t, 
+            threads,
         )
+    _write_t(t, coreg, defo, callback, coreg_t, defo_t)
+
+
+def _write_t(t, coreg, defo, callback, coreg_t, defo_t):
+    if callback is not None:
+        callback(t, coreg_t, defo_t)
+    coreg[...,t] = coreg_t
+    if defo is not None:
+        defo[...,t,:] = defo_t
+
+
+def _coreg_processes(
+        moving, fixed, frames, spacing, method, params, init, init_params, 
+        coreg, transfo, defo, callback, executor, n_workers, threads):
+
+    # Share the images with the workers through shared memory. They are 
+    # passed to elastix as float32 anyway.
+    shape = moving.shape
+    nbytes = int(np.prod(shape)) * np.dtype(np.float32).itemsize
+    shm_moving = shared_memory.SharedMemory(create=True, size=nbytes)
+    shm_fixed = shared_memory.SharedMemory(create=True, size=nbytes)
+    try:
+        moving_shm = np.ndarray(shape, dtype=np.float32, buffer=shm_moving.buf)
+        fixed_shm = np.ndarray(shape, dtype=np.float32, buffer=shm_fixed.buf)
+        for t in frames:
+            moving_shm[...,t] = moving[...,t]
+            fixed_shm[...,t] = fixed[...,t]
+
+        if isinstance(executor, ProcessPoolExecutor):
+            pool = executor
+        else:
+            pool = _process_pool(n_workers)
+        futures = {}
+        try:
+            for t in frames:
+                init_t = None if init is None else _params_maps(init[t])
+                future = pool.submit(
+                    _coreg_worker, t, shm_moving.name, shm_fixed.name, 
+                    shape, spacing, defo is not None, init_t, method, 
+                    params, init_params, threads,
+                )
+                futures[future] = t
+            for future in as_completed(futures):
+                t = futures[future]
+                coreg_t, maps_t, defo_t = future.result()
+                transfo[t] = _params_from_maps(maps_t)
+                _write_t(t, coreg, defo, callback, coreg_t, defo_t)
+        except BrokenProcessPool:
+            # Start a new pool in the next call
+            if pool is not executor:
+                shutdown_pool()
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+    finally:
+        for shm in [shm_moving, shm_fixed]:
+            shm.close()
+            shm.unlink()
+
+
+def _process_pool(n_workers):
+    global _POOL, _POOL_WORKERS
+    with _POOL_LOCK:
+        if _POOL is not None and _POOL_WORKERS != n_workers:
+            _POOL.shutdown()
+            _POOL = None
+        if _POOL is None:
+            # itk is not fork-safe so workers are started afresh
+            _POOL = ProcessPoolExecutor(
+                n_workers, mp_context=multiprocessing.get_context('spawn'),
+            )
+            _POOL_WORKERS = n_workers
+        return _POOL
+
+
+def shutdown_pool():
+    """
+    Shut down the pool of processes used by coreg_series.
+
+    With executor = 'processes', coreg_series keeps its pool of processes 
+    alive so that later calls do not need to start them again. This 
+    function shuts the pool down and frees the resources held by the 
+    workers. A new pool is started by the next call that needs one.
+    """
+    global _POOL, _POOL_WORKERS
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown()
+        _POOL = None
+        _POOL_WORKERS = None
+
+
+def _coreg_worker(t, name_moving, name_fixed, shape, spacing, return_defo, 
+                  init_t, method, params, init_params, threads):
+    shm_moving = shared_memory.SharedMemory(name=name_moving)
+    shm_fixed = shared_memory.SharedMemory(name=name_fixed)
+    try:
+        moving = np.ndarray(shape, dtype=np.float32, buffer=shm_moving.buf)
+        fixed = np.ndarray(shape, dtype=np.float32, buffer=shm_fixed.buf)
+        moving_t = moving[...,t].copy()
+        fixed_t = fixed[...,t].copy()
+    finally:
+        shm_moving.close()
+        shm_fixed.close()
+    # Parameter objects are cached in each worker process, so they are 
+    # only built on first use.
+    init_t = _params_from_maps(init_t)
+    if init_t is None:
+        p_obj = _params_obj(method, **params)
+    else:
+        p_obj = _params_obj(method, **{**params, **init_params})
+    vals = _coreg(
+        moving_t, fixed_t, spacing, p_obj, return_defo, init_t, threads,
+    )
+    defo_t = vals[2] if return_defo else None
+    # Parameter objects cannot be pickled so return the parameter maps
+    return vals[0], _params_maps(vals[1]), defo_t
+
+
+def _params_maps(param_obj):
+    if param_obj is None:
+        return None
+    return [
+        {k: tuple(v) for k, v in param_obj.GetParameterMap(i).items()} 
+        for i in range(param_obj.GetNumberOfParameterMaps())
+    ]
+
+
+def _params_from_maps(maps):
+    if maps is None:
+        return None
+    param_obj = itk.ParameterObject.New()
+    for param_map in maps:
+        param_obj.AddParameterMap(param_map)
+    return param_obj
 
 
 def transform_series(
@@ -208,6 +453,7 @@ def coreg(
         spacing=1.0, 
         method='bspline', 
         return_deformation=False,
+        init=None,
         **params,
     ):
     """
@@ -228,6 +474,11 @@ def coreg(
         or 'translation'. Default is 'bspline'.
     return_deformation : bool
         If set to True, return the deformation field as a third return value
+    init : itk.elastixParameterObject, optional
+        Initial transform, for instance the result of a previous 
+        coregistration. The registration starts from this transform, and 
+        the returned transform contains its parameter maps followed by 
+        those of the registration. Defaults to None.
     params : dict
         Use keyword arguments to overrule any of the default parameters in 
         the elastix template for the chosen method. The default parameters 
@@ -259,13 +510,13 @@ def coreg(
 
     params_obj = _params_obj(method, **params) 
     return_vals = _coreg(
-        moving, fixed, spacing, params_obj, return_deformation,
+        moving, fixed, spacing, params_obj, return_deformation, init,
     )
-    _cleanup(**params)
     return return_vals
 
 
-def _coreg(moving, fixed, spacing, params_obj, return_defo):
+def _coreg(moving, fixed, spacing, params_obj, return_defo, init=None, 
+           threads=None):
     log = False
     # Define spacing
     if np.isscalar(spacing):
@@ -284,11 +535,15 @@ def _coreg(moving, fixed, spacing, params_obj, return_defo):
     itk_fixed.SetSpacing(spacing)
 
     # Perform registration
+    registration = itk.ElastixRegistrationMethod.New(itk_fixed, itk_moving)
+    registration.SetParameterObject(params_obj)
+    registration.SetLogToConsole(log)
+    if init is not None:
+        registration.SetInitialTransformParameterObject(init)
+    if threads is not None:
+        registration.SetNumberOfThreads(threads)
     try:
-        itk_coreg, transfo = itk.elastix_registration_method(
-            itk_fixed, itk_moving, parameter_object=params_obj, 
-            log_to_console=log,
-        )
+        registration.UpdateLargestPossibleRegion()
     except:
         warnings.warn('Elastix coregistration failed. Returning unregistered '
                       'image. To learn more about the error, set log=True.')
@@ -298,15 +553,18 @@ def _coreg(moving, fixed, spacing, params_obj, return_defo):
             return moving.copy(), None
 
     # Return results as numpy arrays
-    coreg = itk.GetArrayFromImage(itk_coreg)   
+    coreg = itk.GetArrayFromImage(registration.GetOutput())
+    transfo = registration.GetTransformParameterObject()
+    if init is not None:
+        transfo = _include_init(transfo, init, params_obj)
 
     # Ad-hoc fix for a bug - not sure why this is needed
     if coreg is None:
         coreg = transform(moving, transfo, spacing) 
 
     if return_defo:
-        defo = itk.transformix_deformation_field(itk_moving, transfo)
-        defo = itk.GetArrayFromImage(defo)
+        defo = _deformation_field(
+            registration.GetCombinationTransform(), itk_fixed)
         defo = np.flip(defo, axis=-1)
         for i, s in enumerate(spacing):
             defo[...,i] = defo[...,i]/s
@@ -315,6 +573,24 @@ def _coreg(moving, fixed, spacing, params_obj, return_defo):
         return coreg, transfo
     
 
+def _include_init(transfo, init, params_obj):
+
+    # itk-elastix returns the initial transform maps followed by the maps 
+    # of the registration (checked with itk-elastix 0.25). Prepend them if 
+    # a version returns the maps of the registration only, so that the 
+    # result can be applied on its own.
+    n_init = init.GetNumberOfParameterMaps()
+    n_reg = params_obj.GetNumberOfParameterMaps()
+    if transfo.GetNumberOfParameterMaps() >= n_init + n_reg:
+        return transfo
+    result = itk.ParameterObject.New()
+    for i in range(n_init):
+        result.AddParameterMap(init.GetParameterMap(i))
+    for i in range(transfo.GetNumberOfParameterMaps()):
+        result.AddParameterMap(transfo.GetParameterMap(i))
+    return result
+
+
 def transform(moving, transfo, spacing=1):
     """
     Transforms an image using a transformation produced by 
@@ -357,67 +633,115 @@ def transform(moving, transfo, spacing=1):
     moving.SetSpacing(spacing)
 
     # Perform transformation
-    transformed = itk.transformix_filter(moving, transfo)
+    return _transformix(moving, transfo)
 
-    # Retur as numpy array
-    transformed = itk.GetArrayFromImage(transformed)
 
-    _cleanup()
 
-    return transformed
+def _transformix(itk_moving, transfo):
+    transformix = itk.TransformixFilter.New(itk_moving)
+    transformix.SetTransformParameterObject(transfo)
+    transformix.SetLogToConsole(False)
+    transformix.UpdateLargestPossibleRegion()
+    return itk.GetArrayFromImage(transformix.GetOutput())
 
 
+def _deformation_field(itk_transform, itk_reference):
 
-def _cleanup(
-        WriteResultImage = 'true',
-        WriteDeformationField = "true", 
-        **params):
-    
-    if WriteDeformationField == 'false':
+    # Transformix writes the deformation field to its output directory 
+    # (the working directory if none is set), so it is sampled from the 
+    # transform with ITK instead, which runs in memory.
+    ndim = itk_reference.GetImageDimension()
+    field_type = itk.Image[itk.Vector[itk.F, ndim], ndim]
+    field = itk.TransformToDisplacementFieldFilter[field_type, itk.D].New()
+    field.SetTransform(itk_transform)
+    field.SetReferenceImage(itk_reference)
+    field.SetUseReferenceImage(True)
+    field.Update()
+    return itk.GetArrayFromImage(field.GetOutput())
 
-        try:
-            os.remove('deformationField.nii')
-        except OSError:
-            pass
-        try:
-            os.remove('deformationField.mhd')
-        except OSError:
-            pass
-        try:
-            os.remove('deformationField.raw')
-        except OSError:
-            pass
 
-        path = os.getcwd()
+def clear_cache():
+    """
+    Clear the cache of elastix parameter objects.
+
+    Parameter objects are cached the first time they are built for a 
+    given method and set of parameters, and copies of the cached object 
+    are returned afterwards. This function frees the memory occupied by 
+    the cache.
+    """
+    with _PARAMS_CACHE_LOCK:
+        _PARAMS_CACHE.clear()
 
-        try:
-            os.remove(os.path.join(path, 'deformationField.nii'))
-        except OSError:
-            pass
-        try:
-            os.remove(os.path.join(path, 'deformationField.mhd'))
-        except OSError:
-            pass
-        try:
-            os.remove(os.path.join(path, 'deformationField.raw'))
-        except OSError:
-            pass
+
+def set_cache_size(maxsize=32):
+    """
+    Set the maximum number of elastix parameter objects held in the cache.
+
+    When the cache is full, the least recently used parameter object is 
+    removed. 
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximum number of cached parameter objects. Set to 0 to disable 
+        caching. The default is 32.
+    """
+    global _PARAMS_CACHE_SIZE
+    if maxsize < 0:
+        raise ValueError("The cache size cannot be negative.")
+    with _PARAMS_CACHE_LOCK:
+        _PARAMS_CACHE_SIZE = maxsize
+        while len(_PARAMS_CACHE) > maxsize:
+            _PARAMS_CACHE.popitem(last=False)
 
 
 def _params_obj(method, **params):
-    param_obj = itk.ParameterObject.New() # long runtime ~20s
-    param_map = param_obj.GetDefaultParameterMap(method) 
-    param_obj.AddParameterMap(param_map)
-    for key, val in params.items():
-        param_obj.SetParameter(key, str(val))
-    return param_obj
 
+    # Parameters are set as strings so this is how they are compared
+    key = (method, tuple(sorted((k, str(v)) for k, v in params.items())))
+
+    with _PARAMS_CACHE_LOCK:
+        param_obj = _PARAMS_CACHE.get(key)
+        if param_obj is not None:
+            _PARAMS_CACHE.move_to_end(key)
+
+    if param_obj is None:
+        # The first call in a process loads itk (~10s), later calls are 
+        # fast.
+        param_obj = itk.ParameterObject.New()
+        param_map = param_obj.GetDefaultParameterMap(method) 
+        param_obj.AddParameterMap(param_map)
+        for key_val, val in key[1]:
+            param_obj.SetParameter(key_val, val)
+        with _PARAMS_CACHE_LOCK:
+            if _PARAMS_CACHE_SIZE > 0:
+                _PARAMS_CACHE[key] = param_obj
+                while len(_PARAMS_CACHE) > _PARAMS_CACHE_SIZE:
+                    _PARAMS_CACHE.popitem(last=False)
+
+    # Return a copy so the cached object is never modified
+    return _clone_params_obj(param_obj)
 
 
+def _clone_params_obj(param_obj):
+    clone = itk.ParameterObject.New()
+    for i in range(param_obj.GetNumberOfParameterMaps()):
+        clone.AddParameterMap(param_obj.GetParameterMap(i))
+    return clone
 
 
 
 
+
+
+
+# Parameters for registrations that start from an initial transform
+INIT_PARAMS = {
+    "NumberOfResolutions": "2",
+    "MaximumNumberOfIterations": "250",
+}
+
+
 # Elastix parameter templates in the form of python dictionaries
 # Taken from the defaults in the elastix model zoo
 # https://github.com/SuperElastix/ElastixModelZoo/tree/master/models/default
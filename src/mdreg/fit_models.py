@@ -1,4 +1,8 @@
 import os
+from functools import partial
+from contextlib import contextmanager
+from concurrent.futures import Executor, ProcessPoolExecutor
+from multiprocessing import shared_memory
 from typing import Union, Tuple
 
 from tqdm import tqdm
@@ -11,6 +15,13 @@ from scipy.optimize import curve_fit
 
 from mdreg import pixel_models, io
 
+try:
+    import distributed
+except:
+    distributed_installed = False
+else:
+    distributed_installed = True
+
 
 def _func_init(xdata, ydata, p0):
     return p0
@@ -61,6 +72,10 @@ def fit_pixels(ydata,
         path = None,
         bounds = (-np.inf, +np.inf),  
         memdim = 2,      
+        solver = 'curve_fit',
+        executor = 'threads',
+        n_workers = None,
+        chunksize = None,
         **kwargs, 
     ):
 
@@ -76,7 +91,12 @@ def fit_pixels(ydata,
         have one argument *xdata* followed by the free parameters of the model. 
         The return value is the signal at each value of *xdata*. 
     p0 : array
-        Initial guess for the model parameters (required)
+        Initial guess for the model parameters (required). This is either 
+        a 1D array with one value per parameter, which is passed to 
+        *func_init* for each pixel, or an array with dimensions (x,y,n) or 
+        (x,y,z,n) with initial values for each pixel. In the latter case 
+        *func_init* is not used, so that the parameters of a previous fit 
+        can be used directly as a warm start.
     xdata : array-like
         Independent variables for the model. If this is not provided, an 
         index array is used.
@@ -102,7 +122,46 @@ def fit_pixels(ydata,
         Bounds for the model parameters, in the format required by 
         scipy.curve_fit. Note the initial value p0 needs to 
         be contained in the bounds.
-    **kwargs : Any additional arguments accepted by scipy.curve_fit().
+    solver : str
+        Optimization engine. With 'curve_fit' (default) each pixel is 
+        fitted separately with scipy.curve_fit. With 'batched' a bounded 
+        Levenberg-Marquardt iteration is run on all pixels in memory at 
+        once using vectorized numpy operations, with the parameters kept 
+        strictly inside the bounds. The batched solver 
+        requires a model that broadcasts over arrays of parameters, 
+        such as the built-in models in `mdreg.pixel_models`. The 
+        keywords *parallel* and *progress_bar* are ignored by the batched 
+        solver.
+    executor : str | concurrent.futures.Executor | distributed.Client
+        Workers used when parallel = True. With 'threads' (default) the 
+        pixels are fitted in a pool of threads, with 'processes' in a pool 
+        of processes that read the data from shared memory, and with 
+        'distributed' on a dask.distributed LocalCluster. The pool or 
+        cluster is started once per call and reused for all slices of a 
+        zarray. To reuse it across calls, pass a running 
+        concurrent.futures.Executor or distributed.Client instead; it is 
+        not shut down afterwards. The process-based executors scale better 
+        with the number of cores but require a *model* and *func_init* 
+        that can be pickled, i.e. functions defined at the top level of 
+        a module.
+    n_workers : int, optional
+        Number of workers used when parallel = True. The default is the 
+        number of CPUs.
+    chunksize : int, optional
+        Number of contiguous pixels that are sent to a worker in a single 
+        task when parallel = True. The default divides the pixels into 
+        4 blocks per worker.
+    **kwargs : Any additional arguments accepted by scipy.curve_fit(). 
+        With solver='batched', the possible keywords are *jac*, *ftol* 
+        and *xtol*, which have the same meaning as in 
+        scipy.optimize.least_squares, and *maxiter*. *maxiter* is the 
+        maximum number of Levenberg-Marquardt iterations (default 100 
+        times the number of parameters). Each iteration evaluates the 
+        model once, plus once per parameter if the Jacobian is 
+        approximated numerically. If *jac* is not provided, the 
+        Jacobian registered for the model with 
+        `mdreg.pixel_models.register_jac` is used. Set jac=None to force 
+        a numerical approximation of the Jacobian.
 
     Returns
     -------
@@ -119,20 +178,55 @@ def fit_pixels(ydata,
     if p0 is None:
         raise ValueError('p0 is a required argument')
     
+    if solver not in ['curve_fit', 'batched']:
+        raise ValueError(
+            f"Solver {solver} is not available. Options are 'curve_fit' "
+            "or 'batched'."
+        )
+    if not _is_pool(executor):
+        if executor not in ['threads', 'processes', 'distributed']:
+            raise ValueError(
+                f"Executor {executor} is not available. Options are "
+                "'threads', 'processes', 'distributed', or a running "
+                "concurrent.futures.Executor or distributed.Client."
+            )
+    if executor == 'distributed' and not distributed_installed:
+        raise ImportError(
+            "The distributed executor is optional - please install mdreg "
+            "as pip install mdreg[distributed] if you want to use this "
+            "feature."
+        )
+    
+    if np.ndim(p0) > 1:
+        if np.shape(p0)[:-1] != ydata.shape[:-1]:
+            raise ValueError(
+                f"Initial values p0 with dimensions {np.shape(p0)} do not "
+                f"match the data with dimensions {ydata.shape}."
+            )
+
     if xdata is None:
         xdata = np.arange(ydata.shape[-1])
 
-    if isinstance(ydata, zarr.Array):
-        fit, par = _fit_pixels_zarr(
-            ydata, model, xdata, func_init, parallel, progress_bar, 
-            bounds, p0, path, memdim, **kwargs)
-    else:
-        fit, par = _fit_pixels_numpy(
-            ydata, model, xdata, func_init, parallel, progress_bar, 
-            bounds, p0, **kwargs)
-        if path is not None:
-            np.save(os.path.join(path, 'fit'), fit)
-            np.save(os.path.join(path, 'pars'), par)
+    # Use the analytical Jacobian of the model if one is registered
+    if 'jac' not in kwargs:
+        jac = pixel_models.get_jac(model)
+        if jac is not None:
+            kwargs['jac'] = jac
+
+    # Workers are started once and used for all slices
+    start_pool = parallel and solver == 'curve_fit'
+    with _pool(executor if start_pool else 'threads', n_workers) as pool:
+        if isinstance(ydata, zarr.Array):
+            fit, par = _fit_pixels_zarr(
+                ydata, model, xdata, func_init, parallel, progress_bar, 
+                bounds, p0, path, memdim, solver, pool, n_workers, 
+                chunksize, **kwargs)
+        else:
+            fit, par = _fit_pixels_numpy(
+                ydata, model, xdata, func_init, parallel, progress_bar, 
+                bounds, p0, solver, pool, n_workers, chunksize, **kwargs)
+            fit = io._save(fit, path, 'fit')
+            par = io._save(par, path, 'pars')
 
     return fit, par
 
@@ -140,29 +234,45 @@ def fit_pixels(ydata,
 
 def _fit_pixels_numpy(
         ydata, model, xdata, func_init, parallel, progress_bar, 
-        bounds,  p0, **kwargs):
+        bounds,  p0, solver='curve_fit', pool=None, n_workers=None, 
+        chunksize=None, **kwargs):
 
     shape = ydata.shape
     ydata = ydata.reshape((-1,shape[-1]))
     nx, nt = ydata.shape
 
+    # Initial values per pixel replace the initializer
+    if np.ndim(p0) > 1:
+        p0 = np.asarray(p0).reshape((nx, -1))
+
+    if solver == 'batched':
+        par = _fit_batched(
+            model, func_init, xdata, ydata, p0, bounds, **kwargs,
+        )
+        fit = _model_batched(model, xdata, par, nt)
+        n = par.shape[-1]
+        return fit.reshape(shape), par.reshape(shape[:-1]+(n,))
+
+    if np.ndim(p0) > 1:
+        func_init = _func_init
+    else:
+        p0 = np.broadcast_to(p0, (nx, len(p0)))
+
     if not parallel:
         p = []
         for x in tqdm(
                 range(nx), desc='Fitting pixels', disable=not progress_bar,
             ):
             p_x = _fit_func(
-                model, func_init, xdata, ydata[x,:], p0, bounds, **kwargs,
+                model, func_init, xdata, ydata[x,:], p0[x,:], bounds, 
+                **kwargs,
             )
             p.append(p_x)
     else:
-        tasks = []
-        for x in range(nx):
-            task_x = dask.delayed(_fit_func)(
-                model, func_init, xdata, ydata[x,:], p0, bounds, **kwargs,
-            )
-            tasks.append(task_x)
-        p = dask.compute(*tasks)
+        p = _fit_blocks(
+            model, func_init, xdata, ydata, p0, bounds, pool, 
+            n_workers, chunksize, **kwargs,
+        )
 
     # Compute output arrays
     n = len(p[0])
@@ -177,9 +287,280 @@ def _fit_pixels_numpy(
     return fit, par
 
 
+def _fit_block(model, func_init, xdata, ydata, p0, bounds, **kwargs):
+    p = []
+    for x in range(ydata.shape[0]):
+        p_x = _fit_func(
+            model, func_init, xdata, ydata[x,:], p0[x,:], bounds, **kwargs,
+        )
+        p.append(p_x)
+    return np.array(p)
+
+
+def _fit_block_shm(name, shape, start, stop, model, func_init, xdata, p0, 
+                   bounds, **kwargs):
+    # Runs in a worker process: read the data from shared memory
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        ydata = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        return _fit_block(
+            model, func_init, xdata, ydata[start:stop,:], p0, bounds, 
+            **kwargs,
+        )
+    finally:
+        shm.close()
+
+
+def _fit_block_scattered(ydata, start, stop, model, func_init, xdata, p0, 
+                         bounds, **kwargs):
+    return _fit_block(
+        model, func_init, xdata, ydata[start:stop,:], p0, bounds, **kwargs,
+    )
+
+
+def _is_pool(executor):
+    if isinstance(executor, Executor):
+        return True
+    if distributed_installed:
+        return isinstance(executor, distributed.Client)
+    return False
+
+
+@contextmanager
+def _pool(executor, n_workers=None):
+
+    # Running pools are used as they are. Pools started here are shut 
+    # down on exit. With threads no pool is needed (None).
+    if _is_pool(executor):
+        yield executor
+    elif executor == 'processes':
+        with ProcessPoolExecutor(n_workers) as pool:
+            yield pool
+    elif executor == 'distributed':
+        with distributed.LocalCluster(
+                n_workers=n_workers, threads_per_worker=1, 
+            ) as cluster, distributed.Client(cluster) as client:
+            yield client
+    else:
+        yield None
+
+
+def _fit_blocks(model, func_init, xdata, ydata, p0, bounds, pool=None, 
+                n_workers=None, chunksize=None, **kwargs):
+
+    # Divide the pixels into contiguous blocks
+    nx = ydata.shape[0]
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    if chunksize is None:
+        chunksize = max(1, -(-nx // (4*n_workers)))
+    blocks = [(i, min(i+chunksize, nx)) for i in range(0, nx, chunksize)]
+
+    if pool is None:
+        tasks = []
+        for start, stop in blocks:
+            task = dask.delayed(_fit_block)(
+                model, func_init, xdata, ydata[start:stop,:], 
+                p0[start:stop,:], bounds, **kwargs,
+            )
+            tasks.append(task)
+        p = dask.compute(*tasks, scheduler='threads', num_workers=n_workers)
+
+    elif isinstance(pool, Executor):
+        # Share the data with the workers instead of pickling them per task
+        ydata = np.asarray(ydata, dtype=np.float64)
+        shm = shared_memory.SharedMemory(create=True, size=ydata.nbytes)
+        try:
+            np.ndarray(ydata.shape, dtype=np.float64, buffer=shm.buf)[:] = ydata
+            futures = [
+                pool.submit(
+                    _fit_block_shm, shm.name, ydata.shape, start, stop, 
+                    model, func_init, xdata, 
+                    np.ascontiguousarray(p0[start:stop,:]), bounds, 
+                    **kwargs,
+                ) for start, stop in blocks
+            ]
+            p = [f.result() for f in futures]
+        finally:
+            shm.close()
+            shm.unlink()
+
+    else:
+        # Send the data to each worker once
+        ydata = pool.scatter(ydata, broadcast=True)
+        futures = [
+            pool.submit(
+                _fit_block_scattered, ydata, start, stop, model, 
+                func_init, xdata, np.ascontiguousarray(p0[start:stop,:]), 
+                bounds, pure=False, **kwargs,
+            ) for start, stop in blocks
+        ]
+        p = pool.gather(futures)
+
+    return np.concatenate(p)
+
+
+def _model_batched(model, xdata, par, nt):
+    # Evaluate the model for all pixels at once, with parameters as 
+    # column vectors so they broadcast against xdata.
+    pars = tuple(par[:,[i]] for i in range(par.shape[-1]))
+    fit = model(xdata, *pars)
+    return np.broadcast_to(fit, (par.shape[0], nt)).astype(np.float64)
+
+
+def _jac_batched(model, jac_func, xdata, par, fit, ub):
+    nx, npar = par.shape
+    if callable(jac_func):
+        pars = tuple(par[:,[i]] for i in range(npar))
+        jac = jac_func(xdata, *pars)
+        return np.broadcast_to(jac, (nx, fit.shape[-1], npar))
+    # Forward differences for all pixels, stepping backwards for 
+    # parameters on the upper bound.
+    jac = np.empty((nx, fit.shape[-1], npar))
+    for i in range(npar):
+        h = np.sqrt(np.finfo(float).eps) * np.maximum(np.abs(par[:,i]), 1)
+        h = np.where(par[:,i] + h > ub[i], -h, h)
+        par_h = par.copy()
+        par_h[:,i] += h
+        fit_h = _model_batched(model, xdata, par_h, fit.shape[-1])
+        jac[:,:,i] = (fit_h - fit) / h[:,None]
+    return jac
+
+
+def _fit_batched(model, func_init, xdata, ydata, p0, bounds, jac=None,
+                 ftol=1e-8, xtol=1e-8, maxiter=None, **kwargs):
+    
+    if kwargs != {}:
+        raise ValueError(
+            f"Keywords {list(kwargs.keys())} are not supported by the "
+            "batched solver."
+        )
+
+    # Initial values for all pixels
+    nx, nt = ydata.shape
+    if np.ndim(p0) > 1:
+        par = np.array(p0, dtype=np.float64)
+    else:
+        par = np.array(
+            [func_init(xdata, ydata[x,:], p0) for x in range(nx)], 
+            dtype=np.float64,
+        )
+    npar = par.shape[-1]
+    lb = np.broadcast_to(np.asarray(bounds[0], dtype=np.float64), (npar,))
+    ub = np.broadcast_to(np.asarray(bounds[1], dtype=np.float64), (npar,))
+    for i in range(npar):
+        below = par[:,i] < lb[i]
+        if np.any(below):
+            p = par[below,i][0]
+            raise ValueError(f"Initial value {p} for parameter {i} is "
+                             f"below the lower bound {lb[i]}.")
+        above = par[:,i] > ub[i]
+        if np.any(above):
+            p = par[above,i][0]
+            raise ValueError(f"Initial value {p} for parameter {i} is "
+                             f"above the upper bound {ub[i]}.")
+    if maxiter is None:
+        maxiter = 100 * npar
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        return _lm_batched(
+            model, jac, xdata, ydata, par, lb, ub, ftol, xtol, maxiter,
+        )
+
+
+def _lm_batched(model, jac_func, xdata, ydata, par, lb, ub, ftol, xtol, 
+                maxiter):
+
+    # Per-pixel state of the iteration
+    nx, nt = ydata.shape
+    npar = par.shape[-1]
+    fit = _model_batched(model, xdata, par, nt)
+    res = ydata - fit
+    cost = np.sum(res**2, axis=-1)
+    damping = np.full(nx, 1e-3)
+    active = np.isfinite(cost)
+
+    for _ in range(maxiter):
+
+        idx = np.nonzero(active)[0]
+        if idx.size == 0:
+            break
+
+        # Damped normal equations for all active pixels
+        p_a = par[idx,:]
+        jac = _jac_batched(model, jac_func, xdata, p_a, fit[idx,:], ub)
+        jtj = np.einsum('xti,xtj->xij', jac, jac)
+        jtr = np.einsum('xti,xt->xi', jac, res[idx,:])
+        diag = np.diagonal(jtj, axis1=1, axis2=2)
+        dmax = np.amax(diag, axis=-1, keepdims=True)
+        diag = np.maximum(diag, 1e-12 * np.where(dmax > 0, dmax, 1))
+        lhs = jtj + damping[idx,None,None] * (
+            diag[:,:,None] * np.eye(npar))
+        step = np.linalg.solve(lhs, jtr[:,:,None])[...,0]
+
+        # Evaluate the step, stopping short of the bounds
+        step = _step_inside(p_a, step, lhs, jtr, lb, ub)
+        p_new = p_a + step
+        fit_new = _model_batched(model, xdata, p_new, nt)
+        res_new = ydata[idx,:] - fit_new
+        cost_new = np.sum(res_new**2, axis=-1)
+
+        # Accept improvements and adapt the damping per pixel. Steps to 
+        # parameters where the model is not finite are rejected.
+        better = np.isfinite(cost_new) & (cost_new < cost[idx])
+        acc = idx[better]
+        dcost = cost[acc] - cost_new[better]
+        dpar = np.linalg.norm(p_new[better] - p_a[better], axis=-1)
+        par[acc,:] = p_new[better]
+        fit[acc,:] = fit_new[better]
+        res[acc,:] = res_new[better]
+        cost[acc] = cost_new[better]
+        damping[acc] /= 10
+        damping[idx[~better]] *= 10
+
+        # Freeze pixels that have converged
+        done = (dcost <= ftol * cost[acc]) | (
+            dpar <= xtol * (xtol + np.linalg.norm(par[acc], axis=-1)))
+        active[acc[done]] = False
+        active[idx[~better][damping[idx[~better]] > 1e16]] = False
+
+    return par
+
+
+def _step_inside(par, step, lhs, jtr, lb, ub, theta=0.5):
+
+    # In one step each parameter covers at most a fraction theta of its 
+    # distance to the bounds. Parameters that would go further are set 
+    # to that limit and the step of the other parameters is solved again 
+    # with these fixed. This keeps the iterates strictly inside the 
+    # bounds, where the models are defined (eg. T > 0), and prevents 
+    # jumps to the flat regions close to them. Parameters on a bound 
+    # that step outwards do not move.
+    npar = par.shape[-1]
+    lo = par + theta * (lb - par)
+    hi = par + theta * (ub - par)
+    fixed = np.zeros(step.shape, dtype=bool)
+    for _ in range(npar+1):
+        p_new = par + step
+        cross = ~fixed & ((p_new < lo) | (p_new > hi))
+        if not np.any(cross):
+            break
+        fixed |= cross
+        d = np.where(p_new < lo, lo - par, 0)
+        d = np.where(p_new > hi, hi - par, d)
+        d = np.where(cross, d, step * fixed)
+        free = ~fixed
+        lhs_free = lhs * (free[:,:,None] & free[:,None,:]) 
+        lhs_free += fixed[:,:,None] * np.eye(npar)
+        rhs = np.where(free, jtr - np.einsum('xij,xj->xi', lhs, d), d)
+        step = np.linalg.solve(lhs_free, rhs[:,:,None])[...,0]
+    return step
+
+
 def _fit_pixels_zarr(
         ydata, model, xdata, func_init, parallel, progress_bar, 
-        bounds, p0, path, memdim, **kwargs):
+        bounds, p0, path, memdim, solver='curve_fit', pool=None, 
+        n_workers=None, chunksize=None, **kwargs):
     
     if memdim is None:
         memdim = ydata.ndim-1
@@ -209,12 +590,17 @@ def _fit_pixels_zarr(
 
         # Load slice z into memory
         ydata_k = ydata[p + z + t]
+        if np.ndim(p0) > 1:
+            p0_k = p0[p + z + t]
+        else:
+            p0_k = p0
 
         # Fit in memory
         fit_k, par_k = _fit_pixels_numpy(
             ydata_k, model, xdata, func_init, parallel, 
             progress_bar=progress_bar and (n==1), 
-            bounds=bounds, p0=p0, **kwargs)
+            bounds=bounds, p0=p0_k, solver=solver, pool=pool, 
+            n_workers=n_workers, chunksize=chunksize, **kwargs)
         
         # If this is the first slice, create the zarrays
         if k==0:
@@ -269,6 +655,8 @@ def fit_exp_decay(
         parallel=True,
         bounds=([0,0], [np.inf, np.inf]),
         p0=[1,1], 
+        method='nonlinear',
+        init=None,
         **kwargs):
     r"""
     Fit to an exponential decay.
@@ -291,8 +679,20 @@ def fit_exp_decay(
             and upper_bound are either a scalar or a list of 2 values.
         p0 : list
             Initial values as a 2-element list.
+        method : str
+            Fitting method. With 'nonlinear' (default) the model is fitted 
+            with `mdreg.fit_pixels`. With 'loglinear' the logarithm of the 
+            signal is fitted to a straight line by weighted linear least 
+            squares, in a single vectorized pass over all pixels. 
+        init : str, optional
+            Set to 'loglinear' to initialize the non-linear fit with the 
+            result of the log-linear fit. If this is not provided, the 
+            default initializer `mdreg.exp_decay_init` is used. This 
+            argument is ignored if method='loglinear'.
         **kwargs :
-            Additional keyword arguments accepted by fit_pixels.
+            Additional keyword arguments accepted by fit_pixels. If 
+            method='loglinear', the possible keywords are *path*, 
+            *memdim* and *progress_bar*.
     
     Returns
     -------
@@ -302,14 +702,44 @@ def fit_exp_decay(
             Fitted model parameters S0 and T. Dimensions are (x,y,2) or 
             (x,y,z,2).
 
+    Notes:
+
+        The log-linear fit uses the linearized model 
+        :math:`\ln S = \ln S_0 - t/T` with weights :math:`S^2`, which 
+        compensate for the amplification of noise at low signal values by 
+        the logarithm. Non-positive signal values are excluded. If the 
+        signal does not decay, T is set to its upper bound.
+
     """
     if time is None:
         raise ValueError('time is a required argument.')
+    if method not in ['nonlinear', 'loglinear']:
+        raise ValueError(
+            f"Method {method} is not available. Options are 'nonlinear' "
+            "or 'loglinear'."
+        )
+    
+    if method == 'loglinear':
+        compute = partial(
+            _fit_exp_decay_loglin_compute, time=np.array(time), 
+            bounds=bounds,
+        )
+        return _fit_fast(signal, compute, 2, parallel=parallel, **kwargs)
+    
+    if init is None:
+        func_init = pixel_models.exp_decay_init
+    elif init == 'loglinear':
+        func_init = partial(_exp_decay_loglin_init, bounds=bounds)
+    else:
+        raise ValueError(
+            f"Initializer {init} is not available. The only option "
+            "is 'loglinear'."
+        )
     
     return fit_pixels(signal,
         model = pixel_models.exp_decay, 
         xdata = np.array(time),
-        func_init = pixel_models.exp_decay_init,
+        func_init = func_init,
         parallel = parallel,
         bounds = bounds,
         p0 = p0, 
@@ -318,12 +748,64 @@ def fit_exp_decay(
 
 
 
+def _exp_decay_loglin_init(t, S, p0, bounds=(-np.inf, np.inf)):
+    _, par = _fit_exp_decay_loglin_compute(
+        np.asarray(S)[None,:], t, bounds,
+    )
+    if not np.all(np.isfinite(par)):
+        return pixel_models.exp_decay_init(t, S, p0)
+    return list(par[0,:])
+
+
+def _fit_exp_decay_loglin_compute(signal, time, bounds):
+
+    # Reshape to 2D (x,t)
+    shape = signal.shape
+    signal = signal.reshape((-1,shape[-1])).astype(np.float64)
+    time = np.asarray(time, dtype=np.float64)
+    lb = np.broadcast_to(np.asarray(bounds[0], dtype=np.float64), (2,))
+    ub = np.broadcast_to(np.asarray(bounds[1], dtype=np.float64), (2,))
+
+    # Weighted sums over the time axis, excluding non-positive values
+    pos = signal > 0
+    w = np.where(pos, signal**2, 0)
+    logS = np.log(np.where(pos, signal, 1))
+    W = np.sum(w, axis=-1)
+    Wt = w @ time
+    Wtt = w @ time**2
+    Wy = np.sum(w*logS, axis=-1)
+    Wty = (w*logS) @ time
+
+    # Solve the 2x2 normal equations of all pixels at once
+    det = W*Wtt - Wt**2
+    valid = det > 1e-12 * W * Wtt
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        slope = np.where(valid, (W*Wty - Wt*Wy)/det, 0)
+        intercept = np.where(valid, (Wtt*Wy - Wt*Wty)/det, 0)
+        S0 = np.where(valid, np.exp(intercept), np.amax(signal, axis=-1))
+        T = np.where(slope < 0, -1/slope, ub[1])
+    S0 = np.clip(np.nan_to_num(S0), lb[0], ub[0])
+    T = np.clip(T, lb[1], ub[1])
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fit = pixel_models.exp_decay(time, S0[:,None], T[:,None])
+    par = np.stack([S0, T], axis=-1)
+
+    # Return in original shape
+    fit = fit.reshape(shape)
+    par = par.reshape(shape[:-1] + (2,))
+
+    return fit, par
+
+
 def fit_abs_exp_recovery_2p(
         signal, 
         TI=None,
         parallel=True,
         bounds=([0,0], [np.inf, np.inf]),
         p0=[1,1.3],
+        method='nonlinear',
+        init=None,
         **kwargs,
     ):
     r"""
@@ -347,8 +829,21 @@ def fit_abs_exp_recovery_2p(
             and upper_bound are either a scalar or a list of 2 values.
         p0 : list
             Initial values as a 2-element list.
+        method : str
+            Fitting method. With 'nonlinear' (default) the model is fitted 
+            with `mdreg.fit_pixels`. With 'grid' the best fit on a grid of 
+            relaxation times is found for all pixels at once, using linear 
+            least squares for the other parameters, and then refined with 
+            the batched solver of `mdreg.fit_pixels`.
+        init : str, optional
+            Set to 'grid' to initialize the non-linear fit with the result 
+            of the grid search. If this is not provided, the default 
+            initializer of the model is used. This argument is ignored if 
+            method='grid'.
         **kwargs :
-            Additional keyword arguments accepted by fit_pixels.
+            Additional keyword arguments accepted by fit_pixels. If 
+            method='grid', the possible keywords are *path*, *memdim* and 
+            *progress_bar*.
     
     Returns
     -------
@@ -362,14 +857,13 @@ def fit_abs_exp_recovery_2p(
     if TI is None:
         raise ValueError('TI is a required parameter.')
 
-    return fit_pixels(signal, 
-        model=pixel_models.abs_exp_recovery_2p, 
-        xdata = np.array(TI),
-        func_init = pixel_models.abs_exp_recovery_2p_init,
-        bounds = bounds,
-        p0 = p0, 
-        parallel = parallel,
-        **kwargs, 
+    return _fit_exp_recovery(
+        signal, 
+        pixel_models.abs_exp_recovery_2p, 
+        np.array(TI), 
+        pixel_models.abs_exp_recovery_2p_init, 
+        parallel, bounds, p0, method, init, 
+        **kwargs,
     )
 
 
@@ -378,6 +872,8 @@ def fit_exp_recovery_2p(signal,
         parallel=True,
         bounds=([0,0], [np.inf, np.inf]),
         p0=[1,1.3], 
+        method='nonlinear',
+        init=None,
         **kwargs):
     r"""
     2-parameter fit to an exponential recovery model
@@ -400,8 +896,21 @@ def fit_exp_recovery_2p(signal,
             and upper_bound are either a scalar or a list of 2 values.
         p0 : list
             Initial values as a 2-element list.
+        method : str
+            Fitting method. With 'nonlinear' (default) the model is fitted 
+            with `mdreg.fit_pixels`. With 'grid' the best fit on a grid of 
+            relaxation times is found for all pixels at once, using linear 
+            least squares for the other parameters, and then refined with 
+            the batched solver of `mdreg.fit_pixels`.
+        init : str, optional
+            Set to 'grid' to initialize the non-linear fit with the result 
+            of the grid search. If this is not provided, the default 
+            initializer of the model is used. This argument is ignored if 
+            method='grid'.
         **kwargs :
-            Additional keyword arguments accepted by fit_pixels.
+            Additional keyword arguments accepted by fit_pixels. If 
+            method='grid', the possible keywords are *path*, *memdim* and 
+            *progress_bar*.
     
     Returns
     -------
@@ -415,23 +924,23 @@ def fit_exp_recovery_2p(signal,
     if TI is None:
         raise ValueError('TI is a required parameter.')
     
-    return fit_pixels(signal, 
-        model=pixel_models.exp_recovery_2p, 
-        xdata=np.array(TI),
-        func_init=pixel_models.exp_recovery_2p_init,
-        parallel=parallel,
-        bounds=bounds,
-        p0=p0, 
-        **kwargs, 
+    return _fit_exp_recovery(
+        signal, 
+        pixel_models.exp_recovery_2p, 
+        np.array(TI), 
+        pixel_models.exp_recovery_2p_init, 
+        parallel, bounds, p0, method, init, 
+        **kwargs,
     )
 
 
-
 def fit_abs_exp_recovery_3p(signal, 
         TI=None,
         parallel=True,
         bounds=([0,0,0], [np.inf, np.inf, 2]),
         p0=[1, 1.3, 2], 
+        method='nonlinear',
+        init=None,
         **kwargs):
     r"""
     2-parameter fit to an absolute exponential-recovery model fit.
@@ -454,8 +963,21 @@ def fit_abs_exp_recovery_3p(signal,
             and upper_bound are either a scalar or a list of 3 values.
         p0 : list
             Initial values as a 3-element list.
+        method : str
+            Fitting method. With 'nonlinear' (default) the model is fitted 
+            with `mdreg.fit_pixels`. With 'grid' the best fit on a grid of 
+            relaxation times is found for all pixels at once, using linear 
+            least squares for the other parameters, and then refined with 
+            the batched solver of `mdreg.fit_pixels`.
+        init : str, optional
+            Set to 'grid' to initialize the non-linear fit with the result 
+            of the grid search. If this is not provided, the default 
+            initializer of the model is used. This argument is ignored if 
+            method='grid'.
         **kwargs :
-            Additional keyword arguments accepted by fit_pixels.
+            Additional keyword arguments accepted by fit_pixels. If 
+            method='grid', the possible keywords are *path*, *memdim* and 
+            *progress_bar*.
     
     Returns
     -------
@@ -469,14 +991,13 @@ def fit_abs_exp_recovery_3p(signal,
     if TI is None:
         raise ValueError('TI is a required parameter.')
     
-    return fit_pixels(signal, 
-        model=pixel_models.abs_exp_recovery_3p, 
-        xdata = np.array(TI),
-        func_init = pixel_models.abs_exp_recovery_3p_init,
-        bounds = bounds,
-        p0 = p0, 
-        parallel = parallel,
-        **kwargs, 
+    return _fit_exp_recovery(
+        signal, 
+        pixel_models.abs_exp_recovery_3p, 
+        np.array(TI), 
+        pixel_models.abs_exp_recovery_3p_init, 
+        parallel, bounds, p0, method, init, 
+        **kwargs,
     )
 
 
@@ -485,6 +1006,8 @@ def fit_exp_recovery_3p(signal,
         parallel=True,
         bounds=([0,0,0],[np.inf, np.inf, 2]),
         p0=[1,1.3,2], 
+        method='nonlinear',
+        init=None,
         **kwargs,
     ):
     r"""
@@ -508,8 +1031,21 @@ def fit_exp_recovery_3p(signal,
             and upper_bound are either a scalar or a list of 3 values.
         p0 : list
             Initial values as a 3-element list.
+        method : str
+            Fitting method. With 'nonlinear' (default) the model is fitted 
+            with `mdreg.fit_pixels`. With 'grid' the best fit on a grid of 
+            relaxation times is found for all pixels at once, using linear 
+            least squares for the other parameters, and then refined with 
+            the batched solver of `mdreg.fit_pixels`.
+        init : str, optional
+            Set to 'grid' to initialize the non-linear fit with the result 
+            of the grid search. If this is not provided, the default 
+            initializer of the model is used. This argument is ignored if 
+            method='grid'.
         **kwargs :
-            Additional keyword arguments accepted by fit_pixels.
+            Additional keyword arguments accepted by fit_pixels. If 
+            method='grid', the possible keywords are *path*, *memdim* and 
+            *progress_bar*.
     
     Returns
     -------
@@ -523,10 +1059,48 @@ def fit_exp_recovery_3p(signal,
     if TI is None:
         raise ValueError('TI is a required parameter.')
     
+    return _fit_exp_recovery(
+        signal, 
+        pixel_models.exp_recovery_3p, 
+        np.array(TI), 
+        pixel_models.exp_recovery_3p_init, 
+        parallel, bounds, p0, method, init, 
+        **kwargs,
+    )
+
+
+def _fit_exp_recovery(signal, model, TI, func_init, parallel, bounds, p0, 
+                      method, init, **kwargs):
+
+    if method not in ['nonlinear', 'grid']:
+        raise ValueError(
+            f"Method {method} is not available. Options are 'nonlinear' "
+            "or 'grid'."
+        )
+    
+    if method == 'grid':
+        compute = partial(
+            _fit_exp_recovery_grid_compute, TI=TI, model=model, 
+            bounds=bounds,
+        )
+        npar = _EXP_RECOVERY[model][0]
+        return _fit_fast(signal, compute, npar, parallel=parallel, **kwargs)
+    
+    if init == 'grid':
+        func_init = partial(
+            _exp_recovery_grid_init, model=model, bounds=bounds, 
+            default=func_init,
+        )
+    elif init is not None:
+        raise ValueError(
+            f"Initializer {init} is not available. The only option "
+            "is 'grid'."
+        )
+
     return fit_pixels(signal, 
-        model=pixel_models.exp_recovery_3p, 
-        xdata = np.array(TI),
-        func_init = pixel_models.exp_recovery_3p_init,
+        model = model, 
+        xdata = TI,
+        func_init = func_init,
         parallel = parallel,
         bounds = bounds,
         p0 = p0, 
@@ -534,6 +1108,128 @@ def fit_exp_recovery_3p(signal,
     )
 
 
+# Number of free parameters and absolute value of the recovery models
+_EXP_RECOVERY = {
+    pixel_models.exp_recovery_2p: (2, False),
+    pixel_models.abs_exp_recovery_2p: (2, True),
+    pixel_models.exp_recovery_3p: (3, False),
+    pixel_models.abs_exp_recovery_3p: (3, True),
+}
+
+
+def _exp_recovery_grid_init(TI, S, p0, model=None, bounds=(-np.inf, np.inf), 
+                            default=None):
+    _, par = _fit_exp_recovery_grid_compute(
+        np.asarray(S)[None,:], TI, model, bounds, refine=False,
+    )
+    if not np.all(np.isfinite(par)):
+        return default(TI, S, p0)
+    return list(par[0,:])
+
+
+def _fit_exp_recovery_grid_compute(signal, TI, model, bounds, refine=True, 
+                                   nT=64, block=4096):
+    
+    npar, absolute = _EXP_RECOVERY[model]
+
+    # Reshape to 2D (x,t)
+    shape = signal.shape
+    signal = signal.reshape((-1,shape[-1])).astype(np.float64)
+    TI = np.asarray(TI, dtype=np.float64)
+    lb = np.broadcast_to(np.asarray(bounds[0], dtype=np.float64), (npar,))
+    ub = np.broadcast_to(np.asarray(bounds[1], dtype=np.float64), (npar,))
+
+    # Grid of relaxation times spanning the range of inversion times
+    TImax = np.amax(np.abs(TI))
+    if TImax == 0:
+        TImax = 1
+    T = np.geomspace(TImax/100, 10*TImax, nT)
+    T = np.unique(np.clip(T, lb[1], ub[1]))
+    T = T[T > 0]
+    order = np.argsort(TI)
+    E = np.exp(-TI[order][None,:]/T[:,None])
+
+    # Grid search in blocks of pixels to limit memory usage
+    par = np.empty((signal.shape[0], npar))
+    for i in range(0, signal.shape[0], block):
+        y = signal[i:i+block, order]
+        if npar == 2:
+            par[i:i+block,:] = _exp_recovery_2p_grid(y, E, T, absolute, lb, ub)
+        else:
+            par[i:i+block,:] = _exp_recovery_3p_grid(y, E, T, absolute, lb, ub)
+
+    # Refine with a non-linear fit starting from the grid values
+    if refine:
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            par = _lm_batched(
+                model, pixel_models.get_jac(model), TI, signal, par, lb, ub, 
+                1e-8, 1e-8, 100*npar,
+            )
+    
+    fit = _model_batched(model, TI, par, shape[-1])
+
+    # Return in original shape
+    fit = fit.reshape(shape)
+    par = par.reshape(shape[:-1] + (npar,))
+
+    return fit, par
+
+
+def _exp_recovery_2p_grid(y, E, T, absolute, lb, ub):
+
+    # For each T the model is linear in S0: S = S0 g
+    g = 1 - 2*E
+    if absolute:
+        g = np.abs(g)
+    gg = np.sum(g**2, axis=-1)
+    yg = y @ g.T
+    S0 = np.clip(yg/gg, lb[0], ub[0])
+    rss = np.sum(y**2, axis=-1)[:,None] - 2*S0*yg + S0**2*gg
+
+    # Select the best T for each pixel
+    k = np.argmin(np.where(np.isnan(rss), np.inf, rss), axis=-1)
+    x = np.arange(y.shape[0])
+    return np.stack([S0[x,k], T[k]], axis=-1)
+
+
+def _exp_recovery_3p_grid(y, E, T, absolute, lb, ub):
+
+    # For each T the model is linear in a=S0 and c=-S0*A: S = a + c E. 
+    # For absolute values, the sign of the first k points (ordered by TI) 
+    # is restored for each possible position k of the signal null.
+    nt = y.shape[-1]
+    nk = nt + 1 if absolute else 1
+    yE = y[:,None,:] * E[None,:,:]
+    cy = np.concatenate([np.zeros(y.shape[:1]+(1,)), np.cumsum(y, -1)], -1)
+    cyE = np.concatenate(
+        [np.zeros(yE.shape[:2]+(1,)), np.cumsum(yE, -1)], -1)
+    sy = (np.sum(y, -1)[:,None] - 2*cy[:,:nk])[:,None,:]
+    syE = np.sum(yE, -1)[...,None] - 2*cyE[...,:nk]
+    sE = np.sum(E, -1)[:,None]
+    sEE = np.sum(E**2, -1)[:,None]
+
+    # Solve the normal equations and apply the bounds
+    with np.errstate(divide='ignore', invalid='ignore'):
+        det = nt*sEE - sE**2
+        a = (sEE*sy - sE*syE)/det
+        c = (nt*syE - sE*sy)/det
+        S0 = np.clip(a, lb[0], ub[0])
+        A = np.clip(np.where(S0 != 0, -c/S0, 0), lb[2], ub[2])
+    c = -S0*A
+
+    # Residuals of the bounded solutions
+    rss = np.sum(y**2, -1)[:,None,None] - 2*(S0*sy + c*syE) 
+    rss += nt*S0**2 + 2*S0*c*sE + c**2*sEE
+
+    # Select the best T and null position for each pixel
+    rss = np.where(np.isnan(rss), np.inf, rss).reshape((y.shape[0], -1))
+    k = np.argmin(rss, axis=-1)
+    x = np.arange(y.shape[0])
+    S0 = S0.reshape((y.shape[0], -1))[x,k]
+    A = A.reshape((y.shape[0], -1))[x,k]
+    return np.stack([S0, T[k // nk], A], axis=-1)
+
+
 def fit_spgr_vfa(signal, 
         FA=None,
         parallel=True,
@@ -590,6 +1286,78 @@ def fit_spgr_vfa(signal,
     )
 
 
+def _fit_fast(signal, compute, npar, path=None, memdim=2, parallel=True, 
+              progress_bar=False, desc='Fitting slices', **kwargs):
+    # Apply a vectorized fit function compute(signal) -> (fit, par) to 
+    # a numpy array, or slice-by-slice to a zarray. 
+
+    if kwargs != {}:
+        raise ValueError(
+            f"Keywords {list(kwargs.keys())} are not supported by this "
+            "fitting method."
+        )
+    
+    if isinstance(signal, np.ndarray):
+        fit, par = compute(signal)
+        fit = io._save(fit, path, 'fit')
+        par = io._save(par, path, 'pars')
+        return fit, par
+    
+    if memdim is None:
+        memdim = signal.ndim-1
+    
+    # Dimension of data in memory
+    if memdim < 0:
+        raise ValueError("memdim cannot be negative.")
+    if memdim > signal.ndim-1:
+        raise ValueError("memdim cannot be larger than signal.ndim-1.")
+
+    # Build stores for outputs
+    fit, par = io._fit_models_init(signal, path, npar)
+
+    # Get the shape and number of slice dimensions
+    shape = signal.shape[memdim:-1]
+    n = int(np.prod(shape))
+
+    # All indices in slice dimensions
+    p = tuple([slice(None) for _ in range(memdim)])
+    
+    if parallel:
+        tasks = [
+            dask.delayed(_fit_fast_slice)(
+                k, signal, shape, p, compute, fit, par,
+            )
+            for k in range(n)
+        ]
+        dask.compute(*tasks)
+    else:
+        for k in tqdm(
+                range(n), 
+                desc=desc, 
+                disable=(not progress_bar) or (n==1),
+            ):
+            _fit_fast_slice(k, signal, shape, p, compute, fit, par)
+
+    return fit, par
+
+
+def _fit_fast_slice(k, signal, shape, p, compute, fit, par):
+
+    # Convert flat index to multi-index
+    z = np.unravel_index(k, shape)
+
+    # Load all values for slice z into memory
+    t = (slice(None), )
+    signal_k = signal[p + z + t]
+
+    # Compute
+    fit_k, par_k = compute(signal_k)
+
+    # Save results for slize z in the zarray
+    fit[p + z + t] = fit_k
+    par[p + z + t] = par_k
+
+
 def fit_spgr_vfa_lin(
         signal:np.ndarray, 
         FA=None, 
@@ -673,125 +1441,63 @@ def fit_spgr_vfa_lin(
             S(\alpha)=\frac{B\sin{\alpha}}{\cos{\alpha}-A}
     
     """
-    if isinstance(signal, zarr.Array):
-        raise ValueError("fit_spgr_vfa_lin is not yet available for zarrays.")
     if FA is None:
         raise ValueError('Flip angle (FA) is a required parameter.')
 
-    if isinstance(signal, np.ndarray):
-        fit, par = _fit_spgr_vfa_lin_compute(signal, FA, progress_bar)
-        if path is not None:
-            np.save(os.path.join(path, 'fit'), fit)
-            np.save(os.path.join(path, 'pars'), par)
-        return fit, par
-    
-    if memdim is None:
-        memdim = signal.ndim-1
-    
-    # Dimension of data in memory
-    if memdim < 0:
-        raise ValueError("memdim cannot be negative.")
-    if memdim > signal.ndim-1:
-        raise ValueError("memdim cannot be larger than signal.ndim-1.")
-
-    # Build stores for outputs
-    fit, par = io._fit_models_init(signal, path, 2)
-
-    # Get the shape and number of slice dimensions
-    shape = signal.shape[memdim:-1]
-    n = int(np.prod(shape))
-
-    # All indices in slice dimensions
-    p = tuple([slice(None) for _ in range(memdim)])
-    
-    if parallel:
-        pbar = False
-        tasks = [
-            dask.delayed(_fit_spgr_vfa_lin_slice)(
-                k, signal, shape, p, FA, fit, par, pbar,
-            )
-            for k in range(n)
-        ]
-        dask.compute(*tasks)
-    else:
-        for k in tqdm(
-                range(n), 
-                desc='Fitting vfa', 
-                disable=(not progress_bar) or (n==1),
-            ):
-            pbar = progress_bar and (n==1)
-            _fit_spgr_vfa_lin_slice(
-                k, signal, shape, p, FA, fit, par, pbar,
-            )
-
-    return fit, par
-
-
-def _fit_spgr_vfa_lin_slice(
-        k, signal, shape, p, FA, fit, par, progress_bar):
-
-    # Convert flat index to multi-index
-    z = np.unravel_index(k, shape)
-
-    # Load all values for slice z into memory
-    t = (slice(None), )
-    signal_k = signal[p + z + t]
-
-    # Compute
-    fit_k, par_k = _fit_spgr_vfa_lin_compute(signal_k, FA, progress_bar)
-
-    # Save results for slize z in the zarray
-    fit[p + z + t] = fit_k
-    par[p + z + t] = par_k
-    
+    compute = partial(_fit_spgr_vfa_lin_compute, FA=FA)
+    return _fit_fast(
+        signal, compute, 2, path=path, memdim=memdim, parallel=parallel, 
+        progress_bar=progress_bar, desc='Fitting vfa',
+    )
 
 
-def _fit_spgr_vfa_lin_compute(signal, FA, progress_bar):
+def _fit_spgr_vfa_lin_compute(signal, FA):
     
     FA = np.deg2rad(FA)
+    sFA, cFA = np.sin(FA), np.cos(FA)
 
-    # Construct FA array in matching shape to signal data
-    FA_array = np.ones_like(signal)*FA
-    sFA_array = np.sin(FA_array)
-
-    X = signal / sFA_array
-    Y = signal * np.cos(FA_array) / sFA_array
-
+    # Reshape to 2D (x,FA)
     shape = signal.shape
-    X = X.reshape(-1, shape[-1])
-    Y = Y.reshape(-1, shape[-1])
     signal = signal.reshape(-1, shape[-1])
-
-    pars = np.empty((X.shape[0], 2))
-    fit = np.empty(X.shape)
-
-    sFA, cFA = np.sin(FA), np.cos(FA)
-    ones = np.ones(shape[-1])
-
-    for i in tqdm(
-            range(X.shape[0]), 
-            desc='Fitting VFA model', 
-            disable=not progress_bar,
-        ):
-        A = np.vstack([X[i,:], ones])
-        pars[i,:] = np.linalg.lstsq(A.T, Y[i,:], rcond=None)[0]
-        if 0 in (cFA - pars[i,0]):
-            fit[i,:] = signal[i,:]
-        else:
-            fit[i,:] = pars[i,1] * sFA / (cFA - pars[i,0])
-        smax = np.amax(signal[i,:])
-        fit[i,:][fit[i,:] > smax] = smax
-
+    n = shape[-1]
+
+    # Linearized variables, broadcasting FA over the pixels
+    X = signal / sFA
+    Y = signal * (cFA / sFA)
+
+    # Solve the normal equations Y = AX + B for all pixels at once
+    Sx = np.sum(X, axis=-1)
+    Sy = np.sum(Y, axis=-1)
+    Sxx = np.sum(X**2, axis=-1)
+    Sxy = np.sum(X*Y, axis=-1)
+    det = n*Sxx - Sx**2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        A = (n*Sxy - Sx*Sy) / det
+        B = (Sy - A*Sx) / n
+
+        # If X is constant the minimum-norm solution is used, as in lstsq
+        c = Sx / n
+        degenerate = np.abs(det) <= 1e-12 * n * Sxx
+        A = np.where(degenerate, c*Sy/n/(c**2+1), A)
+        B = np.where(degenerate, Sy/n/(c**2+1), B)
+        
+        # Reconstruct the signal 
+        denom = cFA - A[:,None]
+        fit = np.where(
+            np.any(denom == 0, axis=-1)[:,None], 
+            signal, 
+            B[:,None] * sFA / denom,
+        )
+    smax = np.amax(signal, axis=-1)
+    fit = np.minimum(fit, smax[:,None])
     fit[fit<0] = 0
     fit[np.isnan(fit)] = 0
 
     # Convert to T1 and S0
-    A = pars[:,0]
-    B = pars[:,1]
-    S0 = -B/(A-1)
-    E = 1/A
-    pars[:,0] = S0
-    pars[:,1] = E
+    with np.errstate(divide='ignore', invalid='ignore'):
+        S0 = -B/(A-1)
+        E = 1/A
+    pars = np.stack([S0, E], axis=-1)
     
     return fit.reshape(shape), pars.reshape(shape[:-1] + (2,))
 
@@ -867,79 +1573,16 @@ def fit_2cm_lin(
                 "Set parallel=False or progress_bar=False. "
             )
     
-    if isinstance(signal, np.ndarray):
-        fit, par = _fit_2cm_lin_compute(
-            signal, aif, time, baseline, progress_bar,
-        )
-        if path is not None:
-            np.save(os.path.join(path, 'fit'), fit)
-            np.save(os.path.join(path, 'pars'), par)
-        return fit, par
-    
-    if memdim is None:
-        memdim = signal.ndim-1
-    
-    # Dimension of data in memory
-    if memdim < 0:
-        raise ValueError("memdim cannot be negative.")
-    if memdim > signal.ndim-1:
-        raise ValueError("memdim cannot be larger than signal.ndim-1.")
-
-    # Build stores for outputs
-    fit, par = io._fit_models_init(signal, path, 4)
-
-    # Get the shape and number of slice dimensions
-    shape = signal.shape[memdim:-1]
-    n = int(np.prod(shape))
-
-    # All indices in slice dimensions
-    p = tuple([slice(None) for _ in range(memdim)])
-    
-    if parallel:
-        pbar = False
-        tasks = [
-            dask.delayed(_fit_2cm_lin_slice)(
-                k, signal, shape, p, aif, time, baseline, fit, par, pbar,
-            )
-            for k in range(n)
-        ]
-        dask.compute(*tasks)
-    else:
-        for k in tqdm(
-                range(n), 
-                desc='Fitting 2cm', 
-                disable=(not progress_bar) or (n==1),
-            ):
-            pbar = progress_bar and (n==1)
-            _fit_2cm_lin_slice(
-                k, signal, shape, p, aif, time, baseline, fit, par, pbar,
-            )
-
-    return fit, par
-
-
-def _fit_2cm_lin_slice(k, signal, shape, p, aif, time, baseline, fit, par, 
-                 progress_bar):
-
-    # Convert flat index to multi-index
-    z = np.unravel_index(k, shape)
-
-    # Load all values for slice z into memory
-    t = (slice(None), )
-    signal_k = signal[p + z + t]
-
-    # Compute
-    fit_k, par_k = _fit_2cm_lin_compute(
-        signal_k, aif, time, baseline, progress_bar,
+    compute = partial(
+        _fit_2cm_lin_compute, aif=aif, time=time, baseline=baseline,
+    )
+    return _fit_fast(
+        signal, compute, 4, path=path, memdim=memdim, parallel=parallel, 
+        progress_bar=progress_bar, desc='Fitting 2cm',
     )
-
-    # Save results for slize z in the zarray
-    fit[p + z + t] = fit_k
-    par[p + z + t] = par_k
-
 
 
-def _fit_2cm_lin_compute(signal, aif, time, baseline, progress_bar):
+def _fit_2cm_lin_compute(signal, aif, time, baseline):
 
     # Reshape to 2D (x,t)
     shape = signal.shape
@@ -948,23 +1591,21 @@ def _fit_2cm_lin_compute(signal, aif, time, baseline, progress_bar):
     S0 = np.mean(signal[:,:baseline], axis=1)
     ca = aif-np.mean(aif[:baseline])
     
-    A = np.empty((signal.shape[1],4))
-    A[:,2], A[:,3] = _ddint(ca, time)
-
-    fit = np.empty(signal.shape)
-    par = np.empty((signal.shape[0], 4))
-    for x in tqdm(
-            range(signal.shape[0]), 
-            desc='Fitting 2-comp model', 
-            disable=not progress_bar,
-        ):
-        c = signal[x,:] - S0[x]
-        ctii, cti = _ddint(c, time)
-        A[:,0] = -ctii
-        A[:,1] = -cti
-        p = np.linalg.lstsq(A, c, rcond=None)[0] 
-        fit[x,:] = S0[x] + p[0]*A[:,0] + p[1]*A[:,1] + p[2]*A[:,2] + p[3]*A[:,3]
-        par[x,:] = _2cm_lin_params(p)
+    # Design matrices of all pixels, with the double integrals of all 
+    # curves computed at once along the time axis.
+    c = signal - S0[:,None]
+    ctii, cti = _ddint(c, time)
+    caii, cai = _ddint(ca, time)
+    A = np.empty(signal.shape + (4,))
+    A[...,0] = -ctii
+    A[...,1] = -cti
+    A[...,2] = caii
+    A[...,3] = cai
+
+    # Solve all linear systems together
+    p = _lstsq_batched(A, c)
+    fit = S0[:,None] + (A @ p[...,None])[...,0]
+    par = _2cm_lin_params(p)
 
     # Apply bounds
     smax = np.amax(signal)
@@ -978,6 +1619,26 @@ def _fit_2cm_lin_compute(signal, aif, time, baseline, progress_bar):
     return fit, par
 
 
+def _lstsq_batched(A, b):
+    # Least-squares solutions of a stack of systems A[k] x = b[k], 
+    # via a batched QR decomposition. Rank-deficient systems get the 
+    # minimum-norm solution, as returned by np.linalg.lstsq.
+    q, r = np.linalg.qr(A)
+    qb = (np.swapaxes(q, -1, -2) @ b[...,None])[...,0]
+    diag = np.abs(np.diagonal(r, axis1=-2, axis2=-1))
+    tol = np.finfo(float).eps * max(A.shape[-2:])
+    rank_deficient = np.any(
+        diag <= tol * np.amax(diag, axis=-1, keepdims=True), axis=-1)
+    rank_deficient |= ~np.all(np.isfinite(r), axis=(-2,-1))
+    x = np.empty(A.shape[:-2] + A.shape[-1:])
+    full = ~rank_deficient
+    x[full] = np.linalg.solve(r[full], qb[full][...,None])[...,0]
+    if np.any(rank_deficient):
+        pinv = np.linalg.pinv(A[rank_deficient])
+        x[rank_deficient] = (pinv @ b[rank_deficient][...,None])[...,0]
+    return x
+
+
 def _ddint(c, t):
     ci = cumulative_trapezoid(c, t, initial=0)
     cii = cumulative_trapezoid(ci, t, initial=0)
@@ -986,37 +1647,28 @@ def _ddint(c, t):
 
 def _2cm_lin_params(X):
 
-    alpha = X[0]
-    beta = X[1]
-    gamma = X[2]
-    Fp = X[3]
-    
-    if alpha == 0: 
-        if beta == 0:
-            return [Fp, 0, 0, 0]
-        else:
-            return [Fp, 1/beta, 0, 0]
+    alpha = X[...,0]
+    beta = X[...,1]
+    gamma = X[...,2]
+    Fp = X[...,3]
 
-    nom = 2*alpha
-    det = beta**2 - 4*alpha
-    if det < 0 :
-        Tp = beta/nom
-        Te = Tp
-    else:
-        root = np.sqrt(det)
-        Tp = (beta - root)/nom
-        Te = (beta + root)/nom
-
-    if Te == 0:
-        PS = 0
-    else:   
-        if Fp == 0:
-            PS = 0
-        else:
-            T = gamma/(alpha*Fp) 
-            PS = Fp*(T-Tp)/Te   
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        nom = 2*alpha
+        det = beta**2 - 4*alpha
+        root = np.sqrt(np.where(det < 0, 0, det))
+        Tp = np.where(det < 0, beta/nom, (beta - root)/nom)
+        Te = np.where(det < 0, Tp, (beta + root)/nom)
+
+        T = gamma/(alpha*Fp) 
+        PS = np.where((Te == 0) | (Fp == 0), 0, Fp*(T-Tp)/Te)   
+
+        # Degenerate case without a second compartment
+        Tp = np.where(alpha == 0, np.where(beta == 0, 0, 1/beta), Tp)
+        Te = np.where(alpha == 0, 0, Te)
+        PS = np.where(alpha == 0, 0, PS)
     
-    return [Fp, Tp, PS, Te]
+    return np.stack([Fp, Tp, PS, Te], axis=-1)
 
 
 
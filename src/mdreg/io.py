@@ -3,10 +3,142 @@ import shutil
 
 import numpy as np
 import zarr
-from zarr.storage import MemoryStore
+from zarr.storage import MemoryStore, LocalStore
+from zarr.codecs import BloscCodec
 import dask.array as da
 
 
+# Options for the zarr arrays created by mdreg
+_ZARR_OPTIONS = {'dtype': None, 'compressor': 'default', 'layout': None}
+
+_COMPRESSORS = {
+    'default': 'auto',
+    'blosc': BloscCodec(cname='zstd', clevel=5, shuffle='shuffle'),
+    'lz4': BloscCodec(cname='lz4', clevel=5, shuffle='shuffle'),
+    None: None,
+}
+
+
+def set_zarr_options(dtype=None, compressor='default', layout=None):
+    """Set the options for zarr arrays created by mdreg.
+
+    The options apply to all zarr arrays created afterwards, in memory or 
+    on disk. Call without arguments to restore the defaults.
+
+    Parameters
+    ----------
+    dtype : str | numpy.dtype, optional
+        Data type of fitted signals, model parameters and deformation 
+        fields, for instance 'float32' or 'float16'. The default is the 
+        data type of the input for zarr arrays and float64 for numpy 
+        arrays.
+    compressor : str | zarr codec, optional
+        Compression of the zarr arrays. Options are 'default' (the zarr 
+        default), 'blosc' (Blosc with zstd), 'lz4' (Blosc with lz4) or 
+        None (no compression). Any zarr bytes-to-bytes codec is also 
+        accepted. Defaults to 'default'.
+    layout : str, optional
+        Chunk layout of the zarr arrays. If None (default), the arrays have 
+        the same chunks as the input. With 'auto', fitted signals and model 
+        parameters are chunked along space with whole time curves in each 
+        chunk, which suits pixel fitting, and coregistered images and 
+        deformation fields have one whole frame per chunk, which suits 
+        registration.
+    """
+    if isinstance(compressor, str) or compressor is None:
+        if compressor not in _COMPRESSORS:
+            raise ValueError(
+                f"Compressor {compressor} is not available. Options are "
+                "'default', 'blosc', 'lz4' or None."
+            )
+    if layout not in [None, 'auto']:
+        raise ValueError(
+            f"Layout {layout} is not available. Options are None or 'auto'."
+        )
+    _ZARR_OPTIONS['dtype'] = dtype
+    _ZARR_OPTIONS['compressor'] = compressor
+    _ZARR_OPTIONS['layout'] = layout
+
+
+def _create(store, shape, chunks, dtype):
+    # Empty chunks are not written so large arrays are allocated instantly
+    compressor = _ZARR_OPTIONS['compressor']
+    if isinstance(compressor, str) or compressor is None:
+        compressor = _COMPRESSORS[compressor]
+    return zarr.create_array(
+        store, 
+        shape=shape, 
+        chunks=chunks, 
+        dtype=dtype, 
+        compressors=compressor,
+        fill_value=0,
+        overwrite=True,
+    )
+
+
+def _dtype(default):
+    if _ZARR_OPTIONS['dtype'] is None:
+        return default
+    return _ZARR_OPTIONS['dtype']
+
+
+def _time_chunks(array, n, dtype):
+    # Chunks with whole time curves or parameter vectors, for n values 
+    # in the last dimension.
+    if _ZARR_OPTIONS['layout'] is None:
+        return array.chunks[:-1] + (n,)
+    chunks = da.core.normalize_chunks(
+        ('auto',) * (array.ndim - 1) + (-1,), 
+        array.shape[:-1] + (n,), 
+        dtype=dtype,
+    )
+    return tuple(c[0] for c in chunks)
+
+
+def _frame_chunks(array):
+    # Chunks with whole frames
+    if _ZARR_OPTIONS['layout'] is None:
+        return array.chunks
+    return array.shape[:-1] + (1,)
+
+
+def _store_path(path, name):
+    if path is None:
+        return MemoryStore()
+    os.makedirs(path, exist_ok=True)
+    return os.path.join(path, name + '.zarr')
+
+
+def _memmap(path, name, shape, dtype, zeros=True):
+
+    # numpy array of zeros backed by the file path/name.npy. An existing 
+    # file with the same shape and type is reused rather than deleted, as 
+    # it may still be mapped (which prevents deletion on Windows). Arrays 
+    # mapped to it see the new values, so results that must be kept are 
+    # copied to memory first (see _move).
+    os.makedirs(path, exist_ok=True)
+    file = os.path.join(path, name + '.npy')
+    if os.path.exists(file):
+        array = np.lib.format.open_memmap(file, mode='r+')
+        if array.shape == tuple(shape) and array.dtype == np.dtype(dtype):
+            if zeros:
+                array[...] = 0
+            return array
+        del array
+        os.remove(file)
+    return np.lib.format.open_memmap(file, mode='w+', dtype=dtype, shape=shape)
+
+
+def _save(array, path, name):
+
+    # Save a numpy array on disk and return the array backed by the file, 
+    # so that later changes are written to disk.
+    if path is None:
+        return array
+    saved = _memmap(path, name, array.shape, array.dtype, zeros=False)
+    saved[...] = array
+    return saved
+
 
 def _remove(path, name):
     if path is None:
@@ -17,40 +149,105 @@ def _remove(path, name):
         shutil.rmtree(store)
 
 
+def _move(array, path, name):
+
+    # Arrays in memory are not overwritten by the next result so they 
+    # can be used as they are.
+    if path is None:
+        return array
+
+    # numpy arrays backed by files are overwritten in place by the next 
+    # result so they are copied to memory.
+    if isinstance(array, np.memmap):
+        return np.array(array)
+    if not isinstance(array, zarr.Array):
+        return array
+    if not isinstance(array.store, LocalStore):
+        return array
+
+    # Zarrays on disk are moved to a new location without copying
+    _remove(path, name)
+    store = os.path.join(path, name + '.zarr')
+    os.replace(array.store.root, store)
+    return zarr.open_array(store, mode='r')
+
+
+def _store(arrays, path, names):
+
+    # Write dask arrays to zarr arrays with the same chunks, computing 
+    # them together so that shared inputs are read only once. zarr needs 
+    # regular chunks.
+    arrays = [array.rechunk(array.chunksize) for array in arrays]
+    zarrays = [
+        _create(_store_path(path, name), array.shape, array.chunksize, 
+                array.dtype)
+        for array, name in zip(arrays, names)
+    ]
+    da.store(arrays, zarrays, lock=False)
+    return zarrays
+
+
+def _rechunk_init(array, path, name, chunks):
+    # Empty copy of a zarray with different chunks
+    return _create(_store_path(path, name), array.shape, chunks, array.dtype)
+
+
+def _rechunk(source, target, frames=None):
+
+    # Copy the time points *frames* of the zarray *source* into the 
+    # zarray *target*, which has different chunks.
+    array = da.from_zarr(source)
+    if frames is not None and len(frames) < source.shape[-1]:
+        array = array[..., list(frames)]
+        target = _Frames(target, frames)
+    array = array.rechunk(target.chunks[:-1] + (-1,))
+    da.store(array, target, lock=False)
+
+
+class _Frames:
+    # Write access to a selection of time points of a zarray
+
+    def __init__(self, array, frames):
+        self.array = array
+        self.frames = np.asarray(frames)
+        self.chunks = array.chunks
+        self.shape = array.shape[:-1] + (len(frames),)
+        self.dtype = array.dtype
+        self.ndim = array.ndim
+
+    def __setitem__(self, key, value):
+        key = key[:-1] + (self.frames[key[-1]],)
+        self.array.set_orthogonal_selection(key, value)
+
+
 def _fit_models_init(signal, path, npar):
 
-    # numpy arrays in memory
+    # numpy arrays in memory or backed by files on disk
     if isinstance(signal, np.ndarray):
-        fit_numpy = np.zeros(signal.shape)
-        par_numpy = np.zeros(signal.shape[:-1] + (npar,))
+        dtype = _dtype(np.float64)
+        if path is None:
+            fit_numpy = np.zeros(signal.shape, dtype=dtype)
+            par_numpy = np.zeros(signal.shape[:-1] + (npar,), dtype=dtype)
+        else:
+            fit_numpy = _memmap(path, 'fit', signal.shape, dtype)
+            par_numpy = _memmap(
+                path, 'pars', signal.shape[:-1] + (npar,), dtype)
         return fit_numpy, par_numpy
 
-    if path is None:
-        # zarrays in memory 
-        store_fit = MemoryStore()
-        store_par = MemoryStore()
-    else:
-        # zarrays on disk
-        os.makedirs(path, exist_ok=True)
-        store_fit = os.path.join(path, 'fit.zarr')
-        store_par = os.path.join(path, 'pars.zarr')
-    
-    fit_dask_array = da.zeros(
+    # zarrays in memory or on disk
+    dtype = _dtype(signal.dtype)
+    fit_zarray = _create(
+        _store_path(path, 'fit'), 
         signal.shape, 
-        dtype=signal.dtype, 
-        chunks=signal.chunks, 
+        _time_chunks(signal, signal.shape[-1], dtype), 
+        dtype,
     )
-    fit_dask_array.to_zarr(store_fit, overwrite=True)
-    fit_zarray = zarr.open_array(store_fit, mode='a')
-
-    par_dask_array = da.zeros(
+    par_zarray = _create(
+        _store_path(path, 'pars'), 
         signal.shape[:-1] + (npar, ), 
-        dtype=signal.dtype, 
-        chunks=signal.chunks[:-1] + (npar,),
+        _time_chunks(signal, npar, dtype), 
+        dtype,
     )
-    par_dask_array.to_zarr(store_par, overwrite=True)
-    par_zarray = zarr.open_array(store_par, mode='a')
-    
     return fit_zarray, par_zarray
 
 
@@ -63,55 +260,35 @@ def _defo(array, path=None, force_2d=False, name='defo'):
     else: #3D
         dshape = array.shape[:4] + (3, ) 
 
-    # Numpy arrays in memory
+    # Numpy arrays in memory or backed by a file on disk
     if isinstance(array, np.ndarray):
-        defo_numpy = np.zeros(dshape)
-        if path is not None:
-            os.makedirs(path, exist_ok=True)
-            np.save(os.path.join(path, name), defo_numpy)
-        return defo_numpy
+        dtype = _dtype(np.float64)
+        if path is None:
+            return np.zeros(dshape, dtype=dtype)
+        return _memmap(path, name, dshape, dtype)
     
-    if path is None:
-        # Zarrays in memory
-        store = MemoryStore()
-    else:
-        # Zarrays on disk
-        os.makedirs(path, exist_ok=True)
-        store = os.path.join(path, name+'.zarr')
-
-
-    defo_dask_array = da.zeros(
+    # Zarrays in memory or on disk
+    return _create(
+        _store_path(path, name), 
         dshape, 
-        dtype=array.dtype, 
-        chunks=array.chunks + (dshape[-1], ), 
+        _frame_chunks(array) + (dshape[-1], ), 
+        _dtype(array.dtype),
     )
-    defo_dask_array.to_zarr(store, overwrite=True)
-    defo_zarray = zarr.open_array(store, mode='a')
-
-    return defo_zarray
 
 
 def _copy(array, path=None, name='copy'):
 
-    # Numpy arrays in memory
+    # Numpy arrays in memory or backed by a file on disk
     if isinstance(array, np.ndarray):
-        copy = array.copy()
-        if path is not None:
-            os.makedirs(path, exist_ok=True)
-            np.save(os.path.join(path, name), copy)
-        return copy
+        if path is None:
+            return array.copy()
+        return _save(array, path, name)
     
-    if path is None:
-        # Zarray in memory
-        store = MemoryStore()
-    else:
-        # Zarray on disk
-        os.makedirs(path, exist_ok=True)  
-        store = os.path.join(path, name+'.zarr')  
-
-    dask_array = da.from_zarr(array)
-    dask_array.to_zarr(store, overwrite=True)
-    copy_zarr = zarr.open_array(store, mode='a')
+    # Zarray in memory or on disk
+    chunks = _frame_chunks(array)
+    copy_zarr = _create(_store_path(path, name), array.shape, chunks, array.dtype)
+    dask_array = da.from_zarr(array).rechunk(chunks)
+    da.store(dask_array, copy_zarr, lock=False)
     return copy_zarr
     
 
@@ -1,10 +1,13 @@
 
 import time
+import threading
+import dask
+import inspect
 import numpy as np
+import zarr
 from tqdm import tqdm
-import dask.array as da
 
-from mdreg import fit_models, elastix, skimage, ants, io
+from mdreg import fit_models, elastix, skimage, ants, io, utils
 
 # TODO: test optional dependencies -> skimage default
 # TODO: user guide introduction
@@ -19,6 +22,13 @@ def fit(moving,
         verbose = 0,
         force_2d = False,
         path = None, 
+        warm_start = False,
+        refit_tol = None,
+        parallel_slices = False,
+        frame_tol = None,
+        frame_criterion = 'maxabs',
+        warm_start_coreg = False,
+        dual_layout = False,
     ):
     """
     Remove motion from a series of 2D- or 3D images.
@@ -68,9 +78,73 @@ def fit(moving,
         2-dimensional registration instead, set *force_2d* to True. This 
         keyword is ignored when the arrays are 2-dimensional. The 
         default is False.
+    parallel_slices : bool, optional
+        If True, slices are fitted in parallel when *force_2d* is True. The 
+        slices are computed with dask on a pool of processes, or on a 
+        dask.distributed cluster if a distributed client is active. With 
+        zarr arrays saved on disk and chunked by slice, each worker writes 
+        its results directly to disk. Ants transforms in memory 
+        (in_memory = True in *fit_coreg*) cannot be returned from other 
+        processes, and raise a ValueError unless a threaded dask scheduler 
+        is configured. This keyword is ignored when *force_2d* is False. 
+        The default is False.
+    frame_tol : float, optional
+        If provided, the change in each time frame is measured after each 
+        coregistration with *frame_criterion*. A frame that has changed by 
+        less than *frame_tol* since the previous iteration is frozen: it is 
+        not coregistered again in later iterations, and its coregistered 
+        image and transformation are retained. The iteration stops when 
+        all frames are frozen. The default is None (coregister all frames 
+        in every iteration).
+    frame_criterion : str | callable, optional
+        Measure of the change in a time frame used with *frame_tol*. 
+        Options are 'maxabs' (maximum absolute change relative to the 
+        maximum of the frame), 'rms' (root-mean-square change relative to 
+        the root-mean-square of the frame) and 'defo' (maximum change in 
+        the norm of the deformation field, in voxel units). 'defo' 
+        requires a coregistration that returns deformation fields, i.e. 
+        skimage, or elastix with return_deformation=True. A custom 
+        criterion can be provided as a function 
+        criterion(coreg_t, coreg_curr_t, defo_t, defo_curr_t) which 
+        returns the change between the current and the new coregistered 
+        frame and deformation field (defo_curr_t is None in the first 
+        iteration). The default is 'maxabs'.
+    warm_start_coreg : bool, optional
+        If True, the deformation field of one iteration is used as the 
+        starting point for the coregistration in the next iteration, so 
+        that only the remaining deformation needs to be estimated. This 
+        is available with skimage and elastix. The default is False.
+    dual_layout : bool | str, optional
+        If True, a second copy of the coregistered images is kept for zarr 
+        arrays, with chunks that contain whole time curves. The model fit 
+        reads from this copy, while the coregistration writes to the 
+        frame-by-frame copy. Only the frames that were coregistered are 
+        copied over in each iteration. With 'auto', the copy is only made 
+        if reading the time curves from the chunks of the coregistered 
+        images is estimated to be slower than copying. This option is 
+        ignored for numpy arrays and with force_2d = True. The default is 
+        False.
     path : str, optional
         Path on disk where to save the results. If no path is provided, the 
-        results are not saved to disk. Defaults to None.
+        results are not saved to disk. For numpy arrays, the results are 
+        memory-mapped .npy files in *path* that are updated in place, so 
+        results returned by an earlier call with the same *path* are 
+        overwritten. Defaults to None.
+    warm_start : bool, optional
+        If True, the model parameters fitted in one iteration are used as 
+        initial values for each pixel in the next iteration. Since the 
+        coregistered data change little between iterations, this reduces 
+        the number of optimizer iterations in the model fit. This requires 
+        *fit_pixels*, or a *fit_image* function that accepts initial 
+        values as keyword argument *p0*. The default is False.
+    refit_tol : float, optional
+        If provided, the signal model is fitted to all pixels only in the 
+        first iteration. In later iterations the fit is only recomputed in 
+        pixels where the coregistered signal at any time point has changed 
+        by more than *refit_tol* of the largest value since the previous 
+        iteration. In the other pixels the fit and parameters of the 
+        previous iteration are retained. The default is None (fit all 
+        pixels in every iteration).
 
     Returns
     -------
@@ -84,7 +158,8 @@ def fit(moving,
         the same dimensions as *moving*, and one additional dimension for the 
         components of the vector field. With elastix this is an array of 
         parameter objects and with ants this is an array of files with 
-        transform parameters. Note when force_2d = True these are 2-dimensional 
+        transform parameters, or of ants transform objects if fit_coreg 
+        contains in_memory = True. Note when force_2d = True these are 2-dimensional 
         arrays with one transform per slice and per time point.
     pars : numpy.ndarray | zarr.Array
         The parameters of the fitted signal model with dimensions (x,y,n) or 
@@ -108,7 +183,8 @@ def fit(moving,
         if force_2d:
             return  _fit_force_2d(
                moving, fit_image, fit_coreg, fit_pixels, tol, maxit, 
-               verbose, path, 
+               verbose, path, warm_start, refit_tol, parallel_slices,
+               frame_tol, frame_criterion, warm_start_coreg,
             )
         
     # Set defaults for fit_image  
@@ -118,6 +194,24 @@ def fit(moving,
     # Check inputs
     if not isinstance(fit_image, dict):
         raise ValueError('The fit_image argument must be a dictionary.')
+    if warm_start and fit_pixels is None:
+        if 'p0' not in inspect.signature(fit_image['func']).parameters:
+            raise ValueError(
+                'A warm start requires a fit_image function that accepts '
+                'initial values p0.'
+            )
+    if frame_tol is not None:
+        frame_criterion = _frame_criterion(frame_criterion, fit_coreg)
+    if warm_start_coreg and fit_coreg['package'] == 'ants':
+        raise ValueError(
+            "A warm start of the coregistration is not available with "
+            f"{fit_coreg['package']}."
+        )
+    if dual_layout not in [False, True, 'auto']:
+        raise ValueError(
+            f"dual_layout {dual_layout} is not available. Options are "
+            "False, True or 'auto'."
+        )
 
     # Set paths    
     _set_path(fit_coreg, path)
@@ -132,6 +226,19 @@ def fit(moving,
     if verbose > 0:
         print('Initializing..')
     coreg = io._copy(moving, path, 'coreg')
+    defo = None
+    frames = list(range(moving.shape[-1]))
+
+    # Copy of the coregistered images with whole time curves in a chunk
+    fit_kwargs = fit_image if fit_pixels is None else fit_pixels
+    pixel_chunks = _dual_layout(
+        coreg, dual_layout, fit_kwargs.get('memdim', 2))
+    if pixel_chunks is None:
+        coreg_fit = coreg
+    else:
+        coreg_fit = io._rechunk_init(
+            coreg, path, 'coreg_pixels', pixel_chunks)
+        io._rechunk(coreg, coreg_fit)
 
     while not converged: 
 
@@ -141,20 +248,71 @@ def fit(moving,
         if verbose > 0:
             print(f'Iteration {it}: fitting signal model')
         if fit_pixels is not None:
-            fit, pars = fit_models.fit_pixels(coreg, **fit_pixels)
+            kwargs = dict(fit_pixels)
         else:
             kwargs = {i:fit_image[i] for i in fit_image if i!='func'}
-            fit, pars = fit_image['func'](coreg, **kwargs)
+        if warm_start and it > 1:
+            # Load into memory so the parameters are not overwritten 
+            # when the new fit is saved in the same location.
+            kwargs['p0'] = np.array(pars[...])
+        if refit_tol is not None and it > 1:
+            fit, pars = _refit(
+                coreg_fit, fit, pars, refit, fit_pixels, fit_image, kwargs)
+        elif fit_pixels is not None:
+            fit, pars = fit_models.fit_pixels(coreg_fit, **kwargs)
+        else:
+            fit, pars = fit_image['func'](coreg_fit, **kwargs)
 
         # Fit deformation
         if verbose > 0:
             print(f'Iteration {it}: fitting deformation fields')
-        coreg_curr = io._copy(coreg, path, 'tmp')
-        vals = _coreg_series(moving, fit, **fit_coreg)
+        coreg_curr = io._move(coreg, path, 'tmp')
+        # Keep the deformations of the previous iteration if they are 
+        # needed, moving them out of the way if they are on disk.
+        if frame_tol is not None or warm_start_coreg:
+            transfo_curr = transfo if it > 1 else None
+            defo_curr = io._move(defo, path, 'tmp_defo')
+            if fit_coreg['package'] == 'skimage':
+                transfo_curr = defo_curr
+        if frame_tol is None:
+            monitor = _Convergence(coreg_curr)
+        else:
+            monitor = _Convergence(coreg_curr, defo_curr, frame_criterion)
+        if warm_start_coreg and it > 1:
+            fit_coreg_it = dict(fit_coreg, init=transfo_curr)
+        else:
+            fit_coreg_it = fit_coreg
+        vals = _coreg_series(
+            moving, fit, frames=frames, callback=monitor, **fit_coreg_it)
         coreg, transfo = vals[:2]
+        defo = _deformation(vals, fit_coreg['package'])
+        registered = frames
+
+        # Frozen frames retain the results of the previous iteration
+        if frame_tol is not None:
+            frozen = [t for t in range(moving.shape[-1]) if t not in frames]
+            for t in frozen:
+                coreg[...,t] = coreg_curr[...,t]
+                if fit_coreg['package'] == 'skimage':
+                    transfo[...,t,:] = transfo_curr[...,t,:]
+                else:
+                    transfo[t] = transfo_curr[t]
+                    if defo is not None:
+                        defo[...,t,:] = defo_curr[...,t,:]
+            frames = [t for t in frames if monitor.change[t] >= frame_tol]
+            if verbose > 0:
+                print(f'Iteration {it}: {len(frames)} of {moving.shape[-1]} '
+                      'frames changed')
 
         # Check convergence
-        converged = _diff(coreg, coreg_curr) < tol
+        converged = monitor.diff() < tol
+        if frame_tol is not None:
+            converged = converged or len(frames) == 0
+        if refit_tol is not None:
+            refit = monitor.diff(axis=-1) > refit_tol
+            if verbose > 0:
+                print(f'Iteration {it}: {np.sum(refit)} of {refit.size} '
+                      'pixels changed')
         
         if verbose > 0:
             print(f'Calculation time for iteration {it}: '
@@ -163,12 +321,20 @@ def fit(moving,
         if it == maxit: 
             break
 
+        # Copy the new coregistered frames for the next fit
+        if pixel_chunks is None:
+            coreg_fit = coreg
+        elif not converged:
+            io._rechunk(coreg, coreg_fit, registered)
+
         it += 1 
 
     if verbose > 0:
         print(f'Total calculation time: {(time.time()-start)/60} min')
 
     io._remove(path, 'tmp')
+    io._remove(path, 'tmp_defo')
+    io._remove(path, 'coreg_pixels')
     if len(vals) > 2: # optional return value
         defo = vals[2]
         return coreg, fit, transfo, pars, defo
@@ -176,11 +342,28 @@ def fit(moving,
         return coreg, fit, transfo, pars
 
 
+# Dask schedulers that run the slices in the same process
+_THREAD_SCHEDULERS = ['threads', 'threading', 'sync', 'synchronous', 
+                      'single-threaded']
+
+
 def _fit_force_2d(
         moving, fit_image, fit_coreg, fit_pixels, tol, maxit, verbose, 
-        path,
+        path, warm_start, refit_tol, parallel_slices=False, frame_tol=None, 
+        frame_criterion='maxabs', warm_start_coreg=False,
     ):
 
+    # Slices fitted in other processes return their transforms by 
+    # pickling them, which is not possible for ants transforms in memory.
+    scheduler = dask.config.get('scheduler', 'processes')
+    if parallel_slices and scheduler not in _THREAD_SCHEDULERS:
+        if fit_coreg['package'] == 'ants' and fit_coreg.get('in_memory'):
+            raise ValueError(
+                "Ants transforms in memory cannot be returned by slices "
+                "fitted in parallel processes. Set in_memory=False in "
+                "fit_coreg, or use a threaded dask scheduler."
+            )
+
     # Required outputs
     coreg = io._copy(moving, path, 'coreg')
     if fit_coreg['package'] == 'skimage':
@@ -204,54 +387,164 @@ def _fit_force_2d(
                 name=fit_coreg['name']+'_defo',
             )
 
-    for k in tqdm(
-            range(moving.shape[2]), 
-            desc='Fitting slice', 
-            disable=verbose<2,
-        ):
-        if verbose == 1:
-            print(f'Fitting slice {k+1} / {moving.shape[2]}')
-
-        if fit_image is None:
-            fit_image_k = None
-        elif isinstance(fit_image, dict):
-            fit_image_k = fit_image
+    kwargs = {
+        'fit_coreg': fit_coreg,
+        'tol': tol,
+        'maxit': maxit,
+        'verbose': verbose,
+        'warm_start': warm_start,
+        'refit_tol': refit_tol,
+        'frame_tol': frame_tol,
+        'frame_criterion': frame_criterion,
+        'warm_start_coreg': warm_start_coreg,
+    }
+
+    # The first slice determines the number of model parameters
+    nz = moving.shape[2]
+    if verbose == 1:
+        print(f'Fitting slice 1 / {nz}')
+    vals = _fit_slice(0, moving, fit_image, fit_pixels, kwargs)
+    fit_arr, pars = io._fit_models_init(moving, path, vals[3].shape[-1])
+    outputs = (coreg, fit_arr, pars, transfo, defo)
+    _write_slice(0, vals, fit_coreg['package'], *outputs)
+
+    if parallel_slices:
+        if verbose > 0:
+            print(f'Fitting slices 2 to {nz} in parallel')
+        # Workers write to disk directly if they can do so safely, 
+        # otherwise they return the results.
+        if _slice_writable(fit_coreg['package'], *outputs):
+            out = outputs
         else:
-            fit_image_k = fit_image[k]
+            out = None
+        tasks = []
+        for k in range(1, nz):
+            task_k = dask.delayed(_fit_slice)(
+                k, _slice_input(moving, k), fit_image, fit_pixels, kwargs, 
+                fit_coreg['package'], out, 
+            )
+            tasks.append(task_k)
+        results = dask.compute(*tasks, scheduler=scheduler)
+        if out is None:
+            for k, vals in zip(range(1, nz), results):
+                vals = _load_transfo(vals, fit_coreg['package'])
+                _write_slice(k, vals, fit_coreg['package'], *outputs)
+    else:
+        for k in tqdm(
+                range(1, nz), 
+                desc='Fitting slice', 
+                disable=verbose<2,
+            ):
+            if verbose == 1:
+                print(f'Fitting slice {k+1} / {nz}')
+            vals = _fit_slice(k, moving, fit_image, fit_pixels, kwargs)
+            _write_slice(k, vals, fit_coreg['package'], *outputs)
 
-        if fit_pixels is None:
-            fit_pixels_k = None
-        elif isinstance(fit_pixels, dict):
-            fit_pixels_k = fit_pixels
-        else:
-            fit_pixels_k = fit_pixels[k]
-
-        vals = fit(
-            moving[:,:,k,:],
-            fit_pixels = fit_pixels_k,
-            fit_image = fit_image_k,
-            fit_coreg = fit_coreg,
-            tol = tol,
-            maxit = maxit,
-            verbose = verbose,
-        )
-        coreg[:,:,k,:], fit_k, transfo_k, pars_k = vals[:4]
-        if k == 0:
-            fit_arr, pars = io._fit_models_init(moving, path, pars_k.shape[-1])              
-        if fit_coreg['package'] == 'skimage':
-            transfo[:,:,k,:,:] = transfo_k
-        else:
-            transfo[k,:] = transfo_k
-        fit_arr[:,:,k,:] = fit_k
-        pars[:,:,k,:] = pars_k
-        if defo is not None:
-            defo[:,:,k,:,:] = vals[4]
     if defo is None:
         return coreg, fit_arr, transfo, pars
     else:
         return coreg, fit_arr, transfo, pars, defo
 
 
+def _fit_slice(k, moving, fit_image, fit_pixels, kwargs, package=None, 
+               out=None):
+
+    if fit_image is None:
+        fit_image_k = None
+    elif isinstance(fit_image, dict):
+        fit_image_k = fit_image
+    else:
+        fit_image_k = fit_image[k]
+
+    if fit_pixels is None:
+        fit_pixels_k = None
+    elif isinstance(fit_pixels, dict):
+        fit_pixels_k = fit_pixels
+    else:
+        fit_pixels_k = fit_pixels[k]
+
+    # moving is either the full array or the single slice k
+    z = 0 if moving.shape[2] == 1 else k
+    vals = fit(
+        moving[:,:,z,:],
+        fit_pixels = fit_pixels_k,
+        fit_image = fit_image_k,
+        tol = kwargs['tol'],
+        maxit = kwargs['maxit'],
+        verbose = kwargs['verbose'],
+        warm_start = kwargs['warm_start'],
+        refit_tol = kwargs['refit_tol'],
+        frame_tol = kwargs['frame_tol'],
+        frame_criterion = kwargs['frame_criterion'],
+        warm_start_coreg = kwargs['warm_start_coreg'],
+        # Copy as fit() sets defaults in place
+        fit_coreg = dict(kwargs['fit_coreg']),
+    )
+    if out is not None:
+        _write_slice(k, vals, package, *out)
+    elif package is None:
+        return vals
+    else:
+        # Results are returned by a worker
+        return _dump_transfo(vals, package)
+
+
+def _slice_input(moving, k):
+    # Zarrays on disk are read by the worker itself. Arrays in memory are 
+    # sliced so that only one slice is sent to each worker.
+    if isinstance(moving, zarr.Array):
+        if isinstance(moving.store, zarr.storage.LocalStore):
+            return moving
+    return moving[:,:,k:k+1,:]
+
+
+def _dump_transfo(vals, package):
+    # elastix parameter objects cannot be pickled so they are returned 
+    # as lists of parameter maps.
+    if package != 'elastix':
+        return vals
+    transfo = [elastix._params_maps(t) for t in vals[2]]
+    return vals[:2] + (transfo,) + tuple(vals[3:])
+
+
+def _load_transfo(vals, package):
+    if package != 'elastix':
+        return vals
+    transfo = np.empty(len(vals[2]), dtype=object)
+    for t, maps in enumerate(vals[2]):
+        transfo[t] = elastix._params_from_maps(maps)
+    return vals[:2] + (transfo,) + tuple(vals[3:])
+
+
+def _write_slice(k, vals, package, coreg, fit_arr, pars, transfo, defo):
+    coreg[:,:,k,:] = vals[0]
+    fit_arr[:,:,k,:] = vals[1]
+    if package == 'skimage':
+        transfo[:,:,k,:,:] = vals[2]
+    else:
+        transfo[k,:] = vals[2]
+    pars[:,:,k,:] = vals[3]
+    if defo is not None:
+        defo[:,:,k,:,:] = vals[4]
+
+
+def _slice_writable(package, *arrays):
+    # Outputs can be written by separate processes if they are zarrays 
+    # on disk with a separate chunk for each slice.
+    if package != 'skimage':
+        return False
+    for a in arrays:
+        if a is None:
+            continue
+        if not isinstance(a, zarr.Array):
+            return False
+        if not isinstance(a.store, zarr.storage.LocalStore):
+            return False
+        if a.chunks[2] != 1:
+            return False
+    return True
+
+
 
 def _set_path(dct, path):
     if dct is None:
@@ -265,15 +558,181 @@ def _set_path(dct, path):
         dct['path'] = path
         
 
-def _diff(coreg, coreg_curr):
+class _Convergence:
+
+    # Keeps running maxima of the change in the coregistered series while 
+    # the new series is computed frame by frame, so the convergence check 
+    # does not need a copy of the full series. If a criterion is provided, 
+    # the change in each frame is also recorded.
+
+    def __init__(self, coreg_curr, defo_curr=None, criterion=None):
+        self.coreg_curr = coreg_curr
+        self.defo_curr = defo_curr
+        self.criterion = criterion
+        self.max_diff = 0
+        self.max_curr = 0
+        self.change = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, t, coreg_t, defo_t=None):
+        curr = self.coreg_curr[...,t]
+        diff = np.abs(coreg_t - curr)
+        max_curr = np.max(np.abs(curr))
+        if self.criterion is not None:
+            if self.defo_curr is None:
+                defo_curr_t = None
+            else:
+                defo_curr_t = self.defo_curr[...,t,:]
+            change = self.criterion(coreg_t, curr, defo_t, defo_curr_t)
+        with self.lock:
+            self.max_diff = np.maximum(self.max_diff, diff)
+            self.max_curr = max(self.max_curr, max_curr)
+            if self.criterion is not None:
+                self.change[t] = change
+
+    def diff(self, axis=None):
+        # Maximum change over all pixels (axis=None) or over time only 
+        # (axis=-1) relative to the largest value of the current series.
+        if axis is None:
+            return np.max(self.max_diff)/self.max_curr
+        else:
+            return self.max_diff/self.max_curr
+
+
+def _frame_maxabs(coreg_t, coreg_curr_t, defo_t, defo_curr_t):
+    norm = np.max(np.abs(coreg_curr_t))
+    diff = np.max(np.abs(coreg_t - coreg_curr_t))
+    return diff/norm if norm > 0 else diff
+
+
+def _frame_rms(coreg_t, coreg_curr_t, defo_t, defo_curr_t):
+    norm = np.sqrt(np.mean(np.square(coreg_curr_t)))
+    diff = np.sqrt(np.mean(np.square(coreg_t - coreg_curr_t)))
+    return diff/norm if norm > 0 else diff
+
+
+def _frame_defo(coreg_t, coreg_curr_t, defo_t, defo_curr_t):
+    if defo_curr_t is None:
+        return np.max(utils.defo_norm(defo_t))
+    return np.max(utils.defo_norm(defo_t - defo_curr_t))
+
+
+_FRAME_CRITERIA = {
+    'maxabs': _frame_maxabs,
+    'rms': _frame_rms,
+    'defo': _frame_defo,
+}
+
+
+def _frame_criterion(criterion, fit_coreg):
+    if callable(criterion):
+        return criterion
+    if criterion not in _FRAME_CRITERIA:
+        raise ValueError(
+            f"Frame criterion {criterion} is not available. Options are "
+            f"{list(_FRAME_CRITERIA)} or a custom function."
+        )
+    if criterion == 'defo':
+        if fit_coreg['package'] == 'ants':
+            raise ValueError(
+                "The 'defo' criterion is not available with ants as it "
+                "does not return deformation fields."
+            )
+        if fit_coreg['package'] == 'elastix':
+            if not fit_coreg.get('return_deformation', False):
+                raise ValueError(
+                    "The 'defo' criterion with elastix requires "
+                    "return_deformation=True in fit_coreg."
+                )
+    return _FRAME_CRITERIA[criterion]
+
+
+def _deformation(vals, package):
+    # The deformation field returned by _coreg_series, if any
+    if package == 'skimage':
+        return vals[1]
+    if len(vals) > 2:
+        return vals[2]
+    return None
+
+
+# Estimated cost of copying the coregistered images to chunks with whole 
+# time curves, relative to reading them once.
+_DUAL_LAYOUT_COST = 3
+
+
+def _dual_layout(coreg, dual_layout, memdim):
+
+    # Returns the chunks of the copy for the model fit, or None if no copy 
+    # is needed.
+    if not dual_layout:
+        return None
+    if not isinstance(coreg, zarr.Array):
+        return None
+    shape = coreg.shape
+    # memdim = None means the whole array is held in memory
+    if memdim is None:
+        memdim = len(shape) - 1
+    memdim = min(memdim, len(shape) - 1)
+    chunks = shape[:memdim] + (1,) * (len(shape) - 1 - memdim) + shape[-1:]
+    if chunks == coreg.chunks:
+        return None
+    if dual_layout == 'auto':
+        cost = _read_amplification(shape, coreg.chunks, chunks)
+        if cost <= _DUAL_LAYOUT_COST:
+            return None
+    return chunks
+
+
+def _read_amplification(shape, chunks, blocks):
+
+    # Volume of the chunks touched when reading an array block by block, 
+    # relative to the volume of the array.
+    amplification = 1
+    for n, c, b in zip(shape, chunks, blocks):
+        read = 0
+        for start in range(0, n, b):
+            stop = min(start + b, n)
+            read += min(((stop - 1) // c + 1) * c, n) - (start // c) * c
+        amplification *= read / n
+    return amplification
+
+
+def _refit(coreg, fit, pars, refit, fit_pixels, fit_image, kwargs):
+
+    # Refit only the pixels flagged in the mask *refit* and write the 
+    # results into *fit* and *pars*.
+    if not np.any(refit):
+        return fit, pars
+    mask = np.broadcast_to(refit[...,None], coreg.shape)
     if isinstance(coreg, np.ndarray):
-        corr = np.max(np.abs(coreg-coreg_curr))/np.max(np.abs(coreg_curr))
+        ydata = coreg[mask]
+    else:
+        ydata = coreg.get_mask_selection(mask)
+    ydata = ydata.reshape((-1, coreg.shape[-1]))
+
+    # The selected pixels are fitted in memory.
+    kwargs.pop('path', None)
+    kwargs.pop('memdim', None)
+    if 'p0' in kwargs:
+        if np.ndim(kwargs['p0']) > 1:
+            kwargs['p0'] = kwargs['p0'][refit]
+    if fit_pixels is not None:
+        fit_mask, pars_mask = fit_models.fit_pixels(ydata, **kwargs)
+    else:
+        fit_mask, pars_mask = fit_image['func'](ydata, **kwargs)
+
+    pmask = np.broadcast_to(refit[...,None], pars.shape)
+    if isinstance(fit, zarr.Array):
+        fit.set_mask_selection(mask, np.ravel(fit_mask))
+        pars.set_mask_selection(pmask, np.ravel(pars_mask))
     else:
-        coreg = da.from_zarr(coreg) 
-        coreg_curr = da.from_zarr(coreg_curr)    
-        corr = da.max(da.abs(coreg-coreg_curr))/da.max(da.abs(coreg_curr))
-        corr.compute()
-    return corr
+        # Arrays backed by files on disk are updated in place
+        if not isinstance(fit, np.ndarray):
+            fit, pars = np.asarray(fit), np.asarray(pars)
+        fit[mask] = np.ravel(fit_mask)
+        pars[pmask] = np.ravel(pars_mask)
+    return fit, pars
 
 
 def _coreg_series(moving, fit, package='elastix', **fit_coreg):
@@ -18,6 +18,20 @@ def const(t, S0):
     return np.full(t.shape, S0, dtype=t.dtype)
 
 
+def const_jac(t, S0):
+    r"""Jacobian of the constant model.
+
+    Args:
+        t (array): array of time points
+        S0 (float): constant value
+
+    Returns:
+        numpy.ndarray: Derivatives with respect to S0, with dimensions 
+        (t,1).
+    """
+    return _stack_jac(np.ones(t.shape))
+
+
 def lin(t, S0, R):
     r"""Linear function.
 
@@ -35,6 +49,22 @@ def lin(t, S0, R):
     """
     return S0 * (1 + R * t)
 
+
+def lin_jac(t, S0, R):
+    r"""Jacobian of the linear function.
+
+    Args:
+        t (array): array of time points
+        S0 (float): signal scaling factor
+        R (float): relaxation rate in units 1/[t]
+
+    Returns:
+        numpy.ndarray: Derivatives with respect to S0 and R, with 
+        dimensions (t,2).
+    """
+    return _stack_jac(1 + R * t, S0 * t)
+
+
 def lin_init(t, S, p0):
     r"""Estimate linear parameters.
 
@@ -69,6 +99,22 @@ def quad(t, S0, R, A):
     return S0 * (1 + R * t + A * t**2)
 
 
+def quad_jac(t, S0, R, A):
+    r"""Jacobian of the quadratic function.
+
+    Args:
+        t (array): array of time points
+        S0 (float): signal scaling factor
+        R (float): relaxation rate in units 1/[t]
+        A (float): amplitude of quadratic term in units of 1/[t]^2
+
+    Returns:
+        numpy.ndarray: Derivatives with respect to S0, R and A, with 
+        dimensions (t,3).
+    """
+    return _stack_jac(1 + R * t + A * t**2, S0 * t, S0 * t**2)
+
+
 def othree(t, S0, R, A, B):
     r"""Third order polynomial function.
 
@@ -89,6 +135,25 @@ def othree(t, S0, R, A, B):
     return S0 * (1 + R * t + A * t**2 + B * t**3)
 
 
+def othree_jac(t, S0, R, A, B):
+    r"""Jacobian of the third order polynomial function.
+
+    Args:
+        t (array): array of time points
+        S0 (float): signal scaling factor
+        R (float): relaxation rate in units 1/[t]
+        A (float): amplitude of quadratic term in units of [t]^2
+        B (float): amplitude of third order term in units of [t]^3
+
+    Returns:
+        numpy.ndarray: Derivatives with respect to S0, R, A and B, with 
+        dimensions (t,4).
+    """
+    return _stack_jac(
+        1 + R * t + A * t**2 + B * t**3, S0 * t, S0 * t**2, S0 * t**3,
+    )
+
+
 def ofour(t, S0, R, A, B, C):
     r"""Foruth order polynomial function.
 
@@ -110,6 +175,27 @@ def ofour(t, S0, R, A, B, C):
     return S0 * (1 + R * t + A * t**2 + B * t**3 + C * t**4)
 
 
+def ofour_jac(t, S0, R, A, B, C):
+    r"""Jacobian of the fourth order polynomial function.
+
+    Args:
+        t (array): array of time points
+        S0 (float): signal scaling factor
+        R (float): relaxation rate in units 1/[t]
+        A (float): amplitude of quadratic term in units of [t]^2
+        B (float): amplitude of third order term in units of [t]^3
+        C (float): amplitude of fourth order term in units of [t]^4
+
+    Returns:
+        numpy.ndarray: Derivatives with respect to S0, R, A, B and C, with 
+        dimensions (t,5).
+    """
+    return _stack_jac(
+        1 + R * t + A * t**2 + B * t**3 + C * t**4, 
+        S0 * t, S0 * t**2, S0 * t**3, S0 * t**4,
+    )
+
+
 def exp_decay(t, S0, T):
     r"""Exponential decay.
 
@@ -128,6 +214,22 @@ def exp_decay(t, S0, T):
     return S0*np.exp(-t/T)
 
 
+def exp_decay_jac(t, S0, T):
+    r"""Jacobian of the exponential decay.
+
+    Args:
+        t (array): array of time points
+        S0 (float): signal scaling factor
+        T (float): relaxation time in same units as t
+
+    Returns:
+        numpy.ndarray: Derivatives with respect to S0 and T, with 
+        dimensions (t,2).
+    """
+    E = np.exp(-t/T)
+    return _stack_jac(E, S0*E*t/T**2)
+
+
 def exp_decay_init(t, S, p0):
     r"""Estimate exponential decay parameters.
 
@@ -159,6 +261,22 @@ def exp_recovery_2p(t, S0, T):
     """
     return S0 * (1 - 2 * np.exp(-t/T))
 
+def exp_recovery_2p_jac(t, S0, T):
+    r"""Jacobian of the exponential recovery with 2 parameters.
+
+    Args:
+        t (array): array of time points
+        S0 (float): signal scaling factor
+        T (float): relaxation time in same units as t
+
+    Returns:
+        numpy.ndarray: Derivatives with respect to S0 and T, with 
+        dimensions (t,2).
+    """
+    E = np.exp(-t/T)
+    return _stack_jac(1 - 2 * E, -2 * S0 * E * t / T**2)
+
+
 def exp_recovery_2p_init(t, S, p0):
     r"""Estimate exponential recovery parameters.
 
@@ -190,6 +308,22 @@ def abs_exp_recovery_2p(t, S0, T):
     """
     return np.abs(S0 * (1 - 2 * np.exp(-t/T)))
 
+def abs_exp_recovery_2p_jac(t, S0, T):
+    r"""Jacobian of the absolute exponential recovery with 2 parameters.
+
+    Args:
+        t (array): array of time points
+        S0 (float): signal scaling factor
+        T (float): relaxation time in same units as t
+
+    Returns:
+        numpy.ndarray: Derivatives with respect to S0 and T, with 
+        dimensions (t,2).
+    """
+    sign = np.sign(exp_recovery_2p(t, S0, T))
+    return sign[...,None] * exp_recovery_2p_jac(t, S0, T)
+
+
 def abs_exp_recovery_2p_init(t, S, p0):
     r"""Estimate exponential recovery parameters.
 
@@ -223,6 +357,23 @@ def exp_recovery_3p(t, S0, T, A):
     return S0 * (1 - A * np.exp(-t/T))
 
 
+def exp_recovery_3p_jac(t, S0, T, A):
+    r"""Jacobian of the exponential recovery with 3 parameters.
+
+    Args:
+        t (array): array of time points
+        S0 (float): signal scaling factor
+        T (float): relaxation time in same units as t
+        A (float): Amplitude of exponential term
+
+    Returns:
+        numpy.ndarray: Derivatives with respect to S0, T and A, with 
+        dimensions (t,3).
+    """
+    E = np.exp(-t/T)
+    return _stack_jac(1 - A * E, -S0 * A * E * t / T**2, -S0 * E)
+
+
 def exp_recovery_3p_init(t, S, p0):
     r"""Estimate exponential recovery parameters.
 
@@ -257,6 +408,23 @@ def abs_exp_recovery_3p(t, S0, T, A):
     return np.abs(S0 * (1 - A * np.exp(-t/T)))
 
 
+def abs_exp_recovery_3p_jac(t, S0, T, A):
+    r"""Jacobian of the absolute exponential recovery with 3 parameters.
+
+    Args:
+        t (array): array of time points
+        S0 (float): signal scaling factor
+        T (float): relaxation time in same units as t
+        A (float): Amplitude of exponential term
+
+    Returns:
+        numpy.ndarray: Derivatives with respect to S0, T and A, with 
+        dimensions (t,3).
+    """
+    sign = np.sign(exp_recovery_3p(t, S0, T, A))
+    return sign[...,None] * exp_recovery_3p_jac(t, S0, T, A)
+
+
 def abs_exp_recovery_3p_init(t, signal, p0):
     r"""Estimate absolute exponential recovery parameters.
 
@@ -296,13 +464,37 @@ def spgr_vfa(FA, S0, E):
     """
     FA = np.deg2rad(FA)
     sFA, cFA = np.sin(FA), np.cos(FA)
-    if 0 in (1 - cFA * E):
-        return S0 * sFA
-    else:
-        return S0 * sFA * (1-E) / (1 - cFA * E) 
+    denom = 1 - cFA * E
+    # Pixels where the denominator is zero are handled separately
+    zero = denom == 0
+    denom = np.where(zero, 1, denom)
+    return np.where(zero, S0 * sFA, S0 * sFA * (1-E) / denom)
     
+
+def spgr_vfa_jac(FA, S0, E):
+    r"""Jacobian of the signal model for a Variable Flip Angle (VFA) scan.
+
+    Args:
+        FA (array): Flip angle :math:`\alpha` in degrees.
+        S0 (float): Signal scaling factor :math:`S_0` in arbitrary units.
+        E (float): Exponential fraction :math:`E = e^{-T_R/T_1}`.
+
+    Returns:
+        numpy.ndarray: Derivatives with respect to S0 and E, with 
+        dimensions (FA,2).
+    """
+    FA = np.deg2rad(FA)
+    sFA, cFA = np.sin(FA), np.cos(FA)
+    denom = 1 - cFA * E
+    zero = denom == 0
+    denom = np.where(zero, 1, denom)
+    return _stack_jac(
+        np.where(zero, sFA, sFA * (1-E) / denom), 
+        np.where(zero, 0 * S0 * sFA, S0 * sFA * (cFA - 1) / denom**2),
+    )
     
 
+
 def spgr_vfa_init(FA, signal, p0):
     """Data-driven initial values for VFA signal model fit.
 
@@ -316,4 +508,58 @@ def spgr_vfa_init(FA, signal, p0):
     """
     sFA = np.sin(FA)
     S0 = np.amax(np.abs(signal))/np.amax(sFA)
-    return [S0*p0[0], p0[1]]
\ No newline at end of file
+    return [S0*p0[0], p0[1]]
+
+
+
+def _stack_jac(*derivs):
+    # Stack derivatives along a new last axis, broadcasting scalar 
+    # and array-valued parameters against the independent variable.
+    return np.stack(np.broadcast_arrays(*derivs), axis=-1)
+
+
+def register_jac(model, jac):
+    """Register the analytical Jacobian of a signal model.
+
+    Registered Jacobians are picked up automatically by `mdreg.fit_pixels` 
+    and the `mdreg.fit_*` functions built on it. The Jacobians of the 
+    built-in signal models are registered by default.
+
+    Args:
+        model (function): Signal model taking the independent variable 
+          followed by the free parameters.
+        jac (function): Function with the same arguments as *model*, which 
+          returns the derivatives of the signal with respect to each free 
+          parameter as an array with one additional last dimension, e.g. 
+          (t,n) for n free parameters.
+    """
+    JACOBIANS[model] = jac
+
+
+def get_jac(model):
+    """Return the registered Jacobian of a signal model.
+
+    Args:
+        model (function): Signal model.
+
+    Returns:
+        function: The registered Jacobian, or None if no Jacobian is 
+        registered for this model.
+    """
+    return JACOBIANS.get(model)
+
+
+# Analytical Jacobians of signal models, keyed by the model function.
+JACOBIANS = {
+    const: const_jac,
+    lin: lin_jac,
+    quad: quad_jac,
+    othree: othree_jac,
+    ofour: ofour_jac,
+    exp_decay: exp_decay_jac,
+    exp_recovery_2p: exp_recovery_2p_jac,
+    abs_exp_recovery_2p: abs_exp_recovery_2p_jac,
+    exp_recovery_3p: exp_recovery_3p_jac,
+    abs_exp_recovery_3p: abs_exp_recovery_3p_jac,
+    spgr_vfa: spgr_vfa_jac,
+}
@@ -1,4 +1,5 @@
 from typing import Tuple, Union
+from functools import lru_cache
 
 from tqdm import tqdm
 import numpy as np
@@ -32,6 +33,9 @@ def coreg_series(
         progress_bar=True, 
         path=None, 
         name='coreg',
+        init=None,
+        frames=None,
+        callback=None,
         **kwargs,
     ):
     """
@@ -55,8 +59,27 @@ def coreg_series(
     name : str, optional
         For data that are saved on disk, provide an optional filename. This 
         argument is ignored if no path is provided.
+    init : numpy.ndarray | zarr.Array, optional
+        Initial deformation field in the same format as the returned 
+        deformation field *defo*, for instance the result of a previous 
+        call. If provided, only the remaining deformation is estimated for 
+        each time point. This must not be stored at the location where 
+        the new deformation field is saved. Defaults to None.
+    frames : list, optional
+        Indices of the time points to coregister. The other time points are 
+        not coregistered: their coregistered image is a copy of the moving 
+        image and their deformation field is zero. Defaults to None 
+        (coregister all time points).
+    callback : callable, optional
+        Function called as callback(t, coreg_t, defo_t) with the 
+        coregistered image coreg_t and the deformation field defo_t at time 
+        point t, before they are written to the output arrays. defo_t is 
+        None if the deformation field is not computed. With 
+        parallel = True, it may be called from several threads at once. 
+        Defaults to None.
     kwargs : dict
-        Any keyword argument accepted by `skimage.registration.optical_flow_tvl1`. 
+        Any keyword argument accepted by `skimage.registration.optical_flow_tvl1`, 
+        and the keyword *quantize* of `mdreg.skimage.coreg`. 
 
     Returns
     -------
@@ -77,30 +100,39 @@ def coreg_series(
             )
     coreg = io._copy(moving, path, name)
     defo = io._defo(moving, path, name=name+'_defo')
+    if frames is None:
+        frames = range(moving.shape[-1])
 
     if parallel:
         tasks = []
-        for t in range(moving.shape[-1]): 
+        for t in frames: 
             task_t = dask.delayed(_coreg_t)(
-                t, moving, fixed, coreg, defo, **kwargs,
+                t, moving, fixed, coreg, defo, init, callback, **kwargs,
             )
             tasks.append(task_t)
         dask.compute(*tasks)
     else:
         for t in tqdm(
-                range(moving.shape[-1]), 
+                frames, 
                 desc='Coregistering series', 
                 disable=not progress_bar,
             ): 
-            _coreg_t(t, moving, fixed, coreg, defo, **kwargs)
+            _coreg_t(
+                t, moving, fixed, coreg, defo, init, callback, **kwargs,
+            )
     
     return coreg, defo
 
 
-def _coreg_t(t, moving, fixed, deformed, deformation, **kwargs):
-    deformed[...,t], deformation[...,t,:] = coreg(
-        moving[...,t], fixed[...,t], **kwargs,
+def _coreg_t(t, moving, fixed, deformed, deformation, init=None, 
+             callback=None, **kwargs):
+    init_t = None if init is None else init[...,t,:]
+    deformed_t, deformation_t = coreg(
+        moving[...,t], fixed[...,t], init=init_t, **kwargs,
     )
+    if callback is not None:
+        callback(t, deformed_t, deformation_t)
+    deformed[...,t], deformation[...,t,:] = deformed_t, deformation_t
 
 def transform_series(
         moving, 
@@ -139,6 +171,8 @@ def transform_series(
 def coreg(
         moving: np.ndarray, 
         fixed: np.ndarray, 
+        init=None,
+        quantize=False,
         **kwargs,
     ) -> Tuple[np.ndarray, np.ndarray]:
 
@@ -151,6 +185,19 @@ def coreg(
         The moving image with dimensions (x,y) or (x,y,z). 
     fixed : numpy.ndarray
         The fixed target image with the same shape as the moving image. 
+    init : numpy.ndarray, optional
+        Initial deformation field, such as the result of a previous 
+        coregistration, in the same format as the returned deformation 
+        field *defo*. If provided, the moving image is first deformed with 
+        *init* and only the remaining deformation is estimated. Since this 
+        is usually small, a single warp is used at each pyramid level 
+        unless *num_warp* is set explicitly. Defaults to None.
+    quantize : bool
+        By default the optical flow is computed on float32 copies of the 
+        images, rescaled to the range [-1, 1]. If quantize is True, the 
+        images are rounded to 16-bit integers instead, which reproduces the 
+        results of earlier versions of mdreg at the cost of precision and 
+        speed. Defaults to False.
     kwargs : dict
         Any keyword argument accepted by `skimage.optical_flow_tvl1`. 
     
@@ -168,61 +215,67 @@ def coreg(
         deformation field need to be multiplied with the voxel dimensions. 
     """
 
-    if moving.ndim == 2: 
-        return _coreg_2d(moving, fixed, **kwargs)
-    if moving.ndim == 3:
-        return _coreg_3d(moving, fixed, **kwargs)
+    if moving.ndim not in [2, 3]:
+        raise ValueError('Only 2D images or 3D volumes can be coregistered.')
+    if init is not None:
+        kwargs.setdefault('num_warp', 1)
+    if quantize:
+        return _coreg_int16(moving, fixed, init, **kwargs)
+    else:
+        return _coreg_float32(moving, fixed, init, **kwargs)
 
 
-def _coreg_2d(moving, fixed, **kwargs):
+def _flow(fixed, moving, init=None, **kwargs):
 
-    # Does not work with float or mixed type for some reason
-    moving, fixed, a, b, dtype = _torange(moving, fixed)
-    
-    rc, cc = np.meshgrid( 
-        np.arange(moving.shape[0]), 
-        np.arange(moving.shape[1]),
-        indexing='ij')
-    row_coords = rc
-    col_coords = cc
-
-    v, u = optical_flow_tvl1(fixed, moving, **kwargs)
-    new_coords = np.array([row_coords + v, col_coords + u])
-    deformation_field = np.stack([v, u], axis=-1)
+    if init is None:
+        return np.stack(optical_flow_tvl1(fixed, moving, **kwargs), axis=-1)
+
+    # Estimate the residual deformation after applying the initial one
+    warped = skiwarp(moving, _coords(init), mode='edge', preserve_range=True)
+    if np.issubdtype(moving.dtype, np.integer):
+        warped = np.around(warped)
+    warped = warped.astype(moving.dtype)
+    residual = np.stack(optical_flow_tvl1(fixed, warped, **kwargs), axis=-1)
+
+    # Compose: defo(x) = residual(x) + init(x + residual(x))
+    coords = _coords(residual)
+    defo = np.empty(residual.shape, dtype=np.result_type(residual, init))
+    for i in range(defo.shape[-1]):
+        defo[...,i] = residual[...,i] + skiwarp(
+            init[...,i], coords, mode='edge', preserve_range=True,
+        )
+    return defo
+
+
+def _coreg_float32(moving, fixed, init=None, **kwargs):
+
+    moving_f, fixed_f = _tofloat32(moving, fixed)
+    deformation_field = _flow(fixed_f, moving_f, init, **kwargs)
+
+    # Warp the original image so no rescaling is needed afterwards
+    new_coords = _coords(deformation_field)
     warped_moving = skiwarp(moving, new_coords, mode='edge', 
                             preserve_range=True)
-    if a is not None:
-        # Scale back to original range and type
-        warped_moving = warped_moving.astype(dtype)
-        warped_moving = (warped_moving-b)/a
-        
+    if moving.dtype in [np.half, np.single, np.double, np.longdouble]:
+        warped_moving = warped_moving.astype(moving.dtype, copy=False)
+
     return warped_moving, deformation_field
 
 
-def _coreg_3d(moving, fixed, **kwargs):
+def _coreg_int16(moving, fixed, init=None, **kwargs):
 
+    # Does not work with float or mixed type for some reason
     moving, fixed, a, b, dtype = _torange(moving, fixed)
-    
-    rc, cc, sc = np.meshgrid( 
-        np.arange(moving.shape[0]), 
-        np.arange(moving.shape[1]),
-        np.arange(moving.shape[2]),
-        indexing='ij')
-    row_coords = rc
-    col_coords = cc
-    slice_coords = sc
-
-    v, u, w = optical_flow_tvl1(fixed, moving, **kwargs)
-    new_coords = np.array([row_coords + v, col_coords + u, slice_coords+w])
-    deformation_field = np.stack([v, u, w], axis=-1)
+
+    deformation_field = _flow(fixed, moving, init, **kwargs)
+    new_coords = _coords(deformation_field)
     warped_moving = skiwarp(moving, new_coords, mode='edge', 
                             preserve_range=True)
-
     if a is not None:
         # Scale back to original range and type
         warped_moving = warped_moving.astype(dtype)
         warped_moving = (warped_moving-b)/a
-
+        
     return warped_moving, deformation_field
 
 
@@ -239,39 +292,58 @@ def transform(moving, defo):
     Returns:
         numpy.ndarray: The transformed image.
     """
+    coords = _coords(defo)
+    return skiwarp(moving, coords, mode='edge', preserve_range=True)
+
+
+@lru_cache(maxsize=8)
+def _grid(shape):
+    # Base coordinates of all pixels, shared between frames of the same 
+    # shape. The cached array must not be modified.
+    grid = np.indices(shape, dtype=np.int32)
+    grid.flags.writeable = False
+    return grid
+
+
+def _coords(defo):
+    # Coordinates of the deformed pixels, computed in a single buffer 
+    # by adding the deformation field to the base coordinates.
+    defo = np.asarray(defo)
+    shape = defo.shape[:-1]
+    grid = _grid(shape)
+    dtype = np.result_type(defo, np.float64)
+    coords = np.empty((len(shape),) + shape, dtype=dtype)
+    for i in range(len(shape)):
+        np.add(grid[i], defo[...,i], out=coords[i])
+    return coords
+
+
+def _tofloat32(moving, fixed):
+
+    # Same range as the int16 images seen by optical_flow_tvl1 in the 
+    # quantized mode, so the default parameters have the same effect.
+    i16 = np.iinfo(np.int16)
+    imin = (float(i16.min) + 16)/i16.max
+    imax = (float(i16.max) - 16)/i16.max
+
+    # get scaling coefficients
+    amin = min(np.amin(moving), np.amin(fixed))
+    amax = max(np.amax(moving), np.amax(fixed))
+    if amax == amin:
+        a = 1
+        b = - amin
+    else:
+        a = (imax-imin)/(amax-amin)
+        b = - a * amin + imin
 
-    if moving.ndim == 2:
-        rc, cc = np.meshgrid( 
-            np.arange(moving.shape[0]), 
-            np.arange(moving.shape[1]),
-            indexing='ij',
-        )
-        row_coords = rc
-        col_coords = cc
-
-        v = defo[:,:,:,0]
-        u = defo[:,:,:,1]
-
-        coords = np.array([row_coords + v, col_coords + u])
-        return skiwarp(moving, coords, mode='edge', preserve_range=True)
-    
-    if moving.ndim == 3:
-        rc, cc, sc = np.meshgrid( 
-            np.arange(moving.shape[0]), 
-            np.arange(moving.shape[1]),
-            np.arange(moving.shape[2]),
-            indexing='ij',
-        )
-        row_coords = rc
-        col_coords = cc
-        slice_coords = sc
-
-        v = defo[:,:,:,0]
-        u = defo[:,:,:,1]
-        w = defo[:,:,:,2]
+    # Scale in place on float32 copies
+    moving = moving.astype(np.float32)
+    fixed = fixed.astype(np.float32)
+    for image in [moving, fixed]:
+        image *= a
+        image += b
 
-        coords = np.array([row_coords + v, col_coords + u, slice_coords+w])
-        return skiwarp(moving, coords, mode='edge', preserve_range=True)
+    return moving, fixed
 
 
 def _torange(moving, fixed):
@@ -1,7 +1,11 @@
 import numpy as np
+import zarr
+import dask.array as da
 
+from mdreg import io
 
-def defo_jacobian_2d(defo):
+
+def defo_jacobian_2d(defo, return_matrix=True, path=None, name='jac'):
     """
     Calculate the Jacobian matrix and determinant from a 2D deformation field.
     Can process multi-slice images, but the actual deformation 
@@ -9,74 +13,270 @@ def defo_jacobian_2d(defo):
     
     Parameters
     ----------
-    defo : np.ndarray
+    defo : np.ndarray | zarr.Array | dask.array.Array
         The deformation field to calculate the Jacobian from.
         Dimensions are expected in the order [x, y, z, t, d], where x, y, z are 
         the spatial dimensions, t is the time/dynamic, and d is the dimension 
-        of the deformation field vector (two for 2D registration).
+        of the deformation field vector (two for 2D registration). If this 
+        is a zarr or dask array, the Jacobian is computed chunk by chunk 
+        and the results are written to zarr arrays with the same chunks.
+    return_matrix : bool
+        If False, only the determinant is returned. Defaults to True.
+    path : str, optional
+        For zarr or dask input, path on disk where to save the results. If 
+        no path is provided, the results are zarr arrays in memory. Defaults 
+        to None.
+    name : str, optional
+        For results saved on disk, the filenames are name_mat and 
+        name_det. Defaults to 'jac'.
 
     Returns
     -------
     jac_mat : np.ndarray
-        The Jacobian matrix of the deformation field with dimensions [x, y, z, t]
+        The Jacobian matrix of the deformation field with dimensions 
+        [x, y, z, t, 2, 2]. For backward compatibility the rows are in 
+        the order of earlier versions: element [0, j] is the derivative 
+        of component 1 along axis j and element [1, j] the derivative of 
+        component 0, plus 1 on the diagonal. 
     jac_det : np.ndarray
-        The determinant of the Jacobian matrix.
+        The determinant of this matrix. Because of the row order this is 
+        not the determinant of the Jacobian of the mapping x + u(x), and 
+        it should not be used to detect folding - use 
+        `mdreg.defo_folding` instead.
     """
     if defo.ndim != 5:
         raise ValueError('Deformation field must have dimensions '
                          '[x, y, z, t, d].')
     if defo.shape[-1] != 2:
         raise ValueError('Deformation field must be 2D.')
+    
+    # The first row holds the derivatives of the second component.
+    return _defo_jacobian(defo, [1, 0], return_matrix, path, name)
 
-    jac_mat = np.zeros((defo.shape[0], defo.shape[1], defo.shape[2], 
-                        defo.shape[3], 2, 2))
-    jac_det = np.zeros((defo.shape[:4]))
 
-    for t in range(defo.shape[3]):
-        for z in range(defo.shape[2]):
-            grad_xx, grad_xy = np.gradient(defo[:, :, z, t, 1])
-            grad_yx, grad_yy = np.gradient(defo[:, :, z, t, 0])
+def defo_jacobian_3d(defo, return_matrix=True, path=None, name='jac'):
+    """
+    Calculate the Jacobian matrix and determinant from a 3D deformation field.
+    
+    Parameters
+    ----------
+    defo : np.ndarray | zarr.Array | dask.array.Array
+        The deformation field to calculate the Jacobian from.
+        Dimensions are expected in the order [x, y, z, t, d], where x, y, z are 
+        the spatial dimensions, t is the time/dynamic, and d is the dimension 
+        of the deformation field vector (three for 3D registration). If this 
+        is a zarr or dask array, the Jacobian is computed chunk by chunk 
+        and the results are written to zarr arrays with the same chunks.
+    return_matrix : bool
+        If False, only the determinant is returned. Defaults to True.
+    path : str, optional
+        For zarr or dask input, path on disk where to save the results. If 
+        no path is provided, the results are zarr arrays in memory. Defaults 
+        to None.
+    name : str, optional
+        For results saved on disk, the filenames are name_mat and 
+        name_det. Defaults to 'jac'.
 
-            grad_xx += 1
-            grad_yy += 1
-            jac_mat[:, :, z, t, 0, 0] = grad_xx
-            jac_mat[:, :, z, t, 0, 1] = grad_xy
-            jac_mat[:, :, z, t, 1, 0] = grad_yx
-            jac_mat[:, :, z, t, 1, 1] = grad_yy
+    Returns
+    -------
+    jac_mat : np.ndarray
+        The Jacobian matrix of the deformation field with dimensions 
+        [x, y, z, t, 3, 3]. Element [i, j] is the derivative of component 
+        i along axis j, plus 1 on the diagonal.
+    jac_det : np.ndarray
+        The determinant of the Jacobian matrix.
+    """
+    if defo.ndim != 5:
+        raise ValueError('Deformation field must have dimensions '
+                         '[x, y, z, t, d].')
+    if defo.shape[-1] != 3:
+        raise ValueError('Deformation field must be 3D.')
+    
+    return _defo_jacobian(defo, [0, 1, 2], return_matrix, path, name)
+
+
+def _defo_jacobian(defo, rows, return_matrix, path=None, name='jac'):
+
+    jac_mat, jac_det = _jacobian(defo, rows)
 
-            jac_det[:, :, z, t] = np.linalg.det(jac_mat[:, :, z, t, :, :])
+    if isinstance(defo, np.ndarray):
+        if return_matrix:
+            return jac_mat, jac_det
+        else:
+            return jac_det
 
+    # Stream the results to zarr in a single pass over the chunks
+    if return_matrix:
+        return io._store(
+            [jac_mat, jac_det], path, [name + '_mat', name + '_det'])
+    else:
+        return io._store([jac_det], path, [name + '_det'])[0]
+
+
+def _jacobian(defo, rows):
+    # Lazy dask arrays for zarr or dask input
+    if isinstance(defo, np.ndarray):
+        jac_mat = _jacobian_matrix(defo, rows)
+    else:
+        jac_mat = _jacobian_matrix_chunked(defo, rows)
+    if len(rows) == 2:
+        jac_det = _det_2d(jac_mat)
+    else:
+        jac_det = _det_3d(jac_mat)
     return jac_mat, jac_det
 
 
-def defo_norm(defo, norm='euclidian'):
+def _jacobian_matrix(defo, rows):
+    # Gradients along all spatial axes of the whole field in one pass
+    n = len(rows)
+    grad = np.gradient(defo, axis=tuple(range(n)))
+    jac_mat = np.empty(defo.shape[:4] + (n, n))
+    for i, row in enumerate(rows):
+        for j in range(n):
+            jac_mat[..., row, j] = grad[j][..., i]
+    for i in range(n):
+        jac_mat[..., i, i] += 1
+    return jac_mat
+
+
+def _jacobian_matrix_chunked(defo, rows):
+    # Chunks overlap by one pixel so the gradients are the same as those 
+    # of the whole field.
+    n = len(rows)
+    defo = _dask(defo).rechunk({4: -1})
+    depth = {i: 1 for i in range(n)}
+    defo = da.overlap.overlap(defo, depth=depth, boundary='none')
+    jac_mat = defo.map_blocks(
+        _jacobian_matrix, 
+        rows,
+        drop_axis=4,
+        new_axis=[4, 5],
+        chunks=defo.chunks[:4] + ((n,), (n,)),
+        dtype=np.float64,
+    )
+    return da.overlap.trim_internal(jac_mat, depth, boundary='none')
+
+
+def _det_2d(m):
+    return m[..., 0, 0] * m[..., 1, 1] - m[..., 0, 1] * m[..., 1, 0]
+
+
+def _det_3d(m):
+    return (
+        m[..., 0, 0] * (m[..., 1, 1] * m[..., 2, 2] - m[..., 1, 2] * m[..., 2, 1])
+        - m[..., 0, 1] * (m[..., 1, 0] * m[..., 2, 2] - m[..., 1, 2] * m[..., 2, 0])
+        + m[..., 0, 2] * (m[..., 1, 0] * m[..., 2, 1] - m[..., 1, 1] * m[..., 2, 0])
+    )
+
+
+def defo_norm(defo, norm='euclidian', path=None, name='defo_norm'):
     """
     Calculate the norm of a deformation field.
     
     Parameters
     ----------
-    defo : np.ndarray
+    defo : np.ndarray | zarr.Array | dask.array.Array
         The deformation field to calculate the norm from. 
         Dimensions are expected in the order [x, y, z, t, d], where x, y, z are 
         the spatial dimensions, t is the time/dynamic, and d is the dimension 
-        of the deformation field (two for 2D registration, 3 for 3D registration)
+        of the deformation field (two for 2D registration, 3 for 3D registration).
+        If this is a zarr or dask array, the norm is computed chunk by chunk 
+        and written to a zarr array with the same chunks.
     norm : str
         The type of norm to use. Options are 'euclidian', 'max' or 'eumip'
         The latter is the maximum projection over time of the euclidian norm.
         Default is 'euclidian'.
+    path : str, optional
+        For zarr or dask input, path on disk where to save the result. If 
+        no path is provided, the result is a zarr array in memory. Defaults 
+        to None.
+    name : str, optional
+        For results saved on disk, the filename. Defaults to 'defo_norm'.
 
     Returns
     -------
-    norm : np.ndarray
+    norm : np.ndarray | zarr.Array
         The norm of the deformation field with dimensions [x, y, z, t] or 
         [x,y,z] (for option 'eumip')
     """
+    if norm not in ['euclidian', 'max', 'eumip']:
+        raise ValueError('Norm ' + str(norm) + ' is not available.')
+    if isinstance(defo, np.ndarray):
+        return _defo_norm(defo, norm)
+    defo_norm = _defo_norm(_dask(defo), norm)
+    return io._store([defo_norm], path, [name])[0]
+
+
+def _defo_norm(defo, norm):
+    # numpy functions dispatch to dask for dask arrays
     if norm == 'euclidian':
         return np.linalg.norm(defo, axis=-1)
     elif norm == 'max':
         return np.amax(defo, axis=-1)
     elif norm == 'eumip':
         return np.amax(np.linalg.norm(defo, axis=-1), axis=-1)
-    else:
-        raise ValueError('Norm ' + str(norm) + ' is not available.')
+
+
+def defo_max_norm(defo):
+    """
+    Calculate the maximum displacement in each frame of a deformation field.
+    
+    Parameters
+    ----------
+    defo : np.ndarray | zarr.Array | dask.array.Array
+        The deformation field with dimensions [x, y, z, t, d]. Zarr and dask 
+        arrays are processed one chunk at a time.
+
+    Returns
+    -------
+    max_norm : np.ndarray
+        The maximum of the euclidian norm over all voxels, with dimensions 
+        [t].
+    """
+    if defo.ndim != 5:
+        raise ValueError('Deformation field must have dimensions '
+                         '[x, y, z, t, d].')
+    if isinstance(defo, np.ndarray):
+        return np.amax(_defo_norm(defo, 'euclidian'), axis=(0, 1, 2))
+    max_norm = np.amax(_defo_norm(_dask(defo), 'euclidian'), axis=(0, 1, 2))
+    return max_norm.compute()
+
+
+def defo_folding(defo):
+    """
+    Calculate the fraction of folding voxels in each frame of a 
+    deformation field.
+
+    Folding voxels are those where the determinant of the Jacobian matrix 
+    is zero or negative.
     
+    Parameters
+    ----------
+    defo : np.ndarray | zarr.Array | dask.array.Array
+        The deformation field with dimensions [x, y, z, t, d], where d is 2 
+        for 2D and 3 for 3D registration. Zarr and dask arrays are 
+        processed one chunk at a time.
+
+    Returns
+    -------
+    folding : np.ndarray
+        The fraction of folding voxels with dimensions [t].
+    """
+    if defo.ndim != 5:
+        raise ValueError('Deformation field must have dimensions '
+                         '[x, y, z, t, d].')
+    if defo.shape[-1] not in [2, 3]:
+        raise ValueError('Deformation field must be 2D or 3D.')
+    # Determinant of the Jacobian of the mapping x + u(x)
+    rows = list(range(defo.shape[-1]))
+    _, jac_det = _jacobian(defo, rows)
+    folding = np.mean(jac_det <= 0, axis=(0, 1, 2))
+    if isinstance(defo, np.ndarray):
+        return folding
+    return folding.compute()
+
+
+def _dask(defo):
+    if isinstance(defo, zarr.Array):
+        return da.from_zarr(defo)
+    return da.asarray(defo)
@@ -0,0 +1,190 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+import zarr
+
+import mdreg
+from mdreg import fit_models, pixel_models
+
+
+TI = np.array([100, 180, 260, 1000, 1080, 1160, 2000, 3000, 4000]) / 1000
+
+RECOVERY = {
+    'exp_recovery_2p': ([1, 1.3], ([0, 0], [np.inf, np.inf])),
+    'abs_exp_recovery_2p': ([1, 1.3], ([0, 0], [np.inf, np.inf])),
+    'exp_recovery_3p': ([1, 1.3, 2], ([0, 0, 0], [np.inf, np.inf, 2])),
+    'abs_exp_recovery_3p': ([1, 1.3, 2], ([0, 0, 0], [np.inf, np.inf, 2])),
+}
+
+
+def _recovery_signal(name, n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    model = getattr(pixel_models, name)
+    pars = [rng.uniform(200, 800, n), rng.uniform(0.2, 1.5, n)]
+    if name.endswith('3p'):
+        pars.append(rng.uniform(1.7, 2.0, n))
+    signal = model(TI, *[p[:,None] for p in pars])
+    return signal + rng.normal(size=signal.shape) * 10
+
+
+def _rss(signal, fit):
+    return np.sum((signal - fit)**2, axis=-1)
+
+
+@pytest.mark.parametrize('name', list(RECOVERY))
+@pytest.mark.parametrize('jac', [True, False])
+def test_fit_pixels_batched(name, jac):
+    signal = _recovery_signal(name)
+    p0, bounds = RECOVERY[name]
+    kwargs = {
+        'model': getattr(pixel_models, name),
+        'xdata': TI,
+        'func_init': getattr(pixel_models, name + '_init'),
+        'p0': p0,
+        'bounds': bounds,
+        'progress_bar': False,
+    }
+    fit_c, par_c = mdreg.fit_pixels(signal, parallel=False, **kwargs)
+    fit_b, par_b = mdreg.fit_pixels(
+        signal, solver='batched',
+        jac=getattr(pixel_models, name + '_jac') if jac else None,
+        **kwargs,
+    )
+    rss_c = _rss(signal, fit_c)
+    rss_b = _rss(signal, fit_b)
+
+    # Parameters stay inside the bounds where the model is defined
+    assert np.all(np.isfinite(par_b))
+    assert np.all(par_b[:,1] > 0)
+    assert np.all(par_b >= bounds[0])
+    assert np.all(par_b <= bounds[1])
+
+    worse = rss_b > 1.001 * rss_c
+    if name.startswith('abs'):
+        # The absolute models have local minima, which either solver may
+        # end up in for a few pixels.
+        assert np.mean(worse) < 0.03
+        assert np.max(rss_b / rss_c) < 20
+    else:
+        assert not np.any(worse)
+
+
+@pytest.mark.parametrize('name', list(RECOVERY))
+def test_fit_exp_recovery_grid(name):
+    signal = _recovery_signal(name)
+    func = getattr(fit_models, 'fit_' + name)
+    fit_c, _ = func(signal, TI=TI, parallel=False, progress_bar=False)
+    fit_g, par_g = func(signal, TI=TI, method='grid')
+    rss_c = _rss(signal, fit_c)
+    rss_g = _rss(signal, fit_g)
+    assert np.all(par_g[:,1] > 0)
+    assert np.mean(rss_g > 1.001 * rss_c) < 0.03
+    assert np.max(rss_g / rss_c) < 20
+
+
+def _zarr(array, chunks=None):
+    if chunks is None:
+        chunks = array.shape[:2] + (1, array.shape[-1])
+    zarray = zarr.create_array(
+        store=zarr.storage.MemoryStore(), shape=array.shape, chunks=chunks, 
+        dtype=array.dtype,
+    )
+    zarray[:] = array
+    return zarray
+
+
+def _fast_fits():
+    rng = np.random.default_rng(1)
+    shape = (8, 6, 3, 1)
+    FA = np.array([2, 5, 10, 15, 20, 25, 30])
+    S0 = rng.uniform(100, 500, shape)
+    E = rng.uniform(0.8, 0.99, shape)
+    vfa = mdreg.spgr_vfa(FA, S0, E)
+    time = np.linspace(0, 0.1, 6)
+    decay = mdreg.exp_decay(time, S0, rng.uniform(0.02, 0.08, shape))
+    recovery = mdreg.exp_recovery_2p(TI, S0, rng.uniform(0.2, 1.5, shape))
+    t = np.arange(20.)
+    aif = np.exp(-(t-5)**2/4) * (t > 2)
+    signal_2cm = 1 + rng.random(shape[:3] + (20,)) * aif
+    return [
+        (mdreg.fit_spgr_vfa_lin, vfa, {'FA': FA}, (S0, E)),
+        (mdreg.fit_exp_decay, decay, 
+         {'time': time, 'method': 'loglinear'}, None),
+        (mdreg.fit_exp_recovery_2p, recovery, 
+         {'TI': TI, 'method': 'grid'}, None),
+        (mdreg.fit_2cm_lin, signal_2cm, 
+         {'aif': aif, 'time': t, 'baseline': 2, 'progress_bar': False}, 
+         None),
+    ]
+
+
+@pytest.mark.parametrize('i', range(4))
+def test_fit_fast(i):
+    func, signal, kwargs, true = _fast_fits()[i]
+    fit, pars = func(signal, **kwargs)
+    assert fit.shape == signal.shape
+    if true is not None:
+        assert np.allclose(pars[...,0], true[0][...,0])
+        assert np.allclose(pars[...,1], true[1][...,0])
+    # Zarrays are fitted slice by slice with the same result
+    for parallel in [False, True]:
+        zfit, zpars = func(_zarr(signal), parallel=parallel, **kwargs)
+        assert isinstance(zfit, zarr.Array)
+        assert np.allclose(zfit[:], fit)
+        assert np.allclose(zpars[:], pars)
+
+
+def _executor_kwargs():
+    return {
+        'model': pixel_models.exp_recovery_2p,
+        'xdata': TI,
+        'func_init': pixel_models.exp_recovery_2p_init,
+        'p0': [1, 1.3],
+        'bounds': ([0, 0], [np.inf, np.inf]),
+        'progress_bar': False,
+        'n_workers': 2,
+    }
+
+
+def test_fit_pixels_executor():
+    signal = _recovery_signal('exp_recovery_2p', n=48).reshape(4, 4, 3, -1)
+    kwargs = _executor_kwargs()
+    fit, pars = mdreg.fit_pixels(signal, parallel=False, **kwargs)
+    for executor in ['threads', 'processes']:
+        fit_e, pars_e = mdreg.fit_pixels(
+            signal, parallel=True, executor=executor, **kwargs)
+        assert np.allclose(fit_e, fit)
+        assert np.allclose(pars_e, pars)
+    # A running pool is used for all slices of a zarray
+    with ProcessPoolExecutor(2) as pool:
+        fit_e, pars_e = mdreg.fit_pixels(
+            _zarr(signal), parallel=True, executor=pool, **kwargs)
+        assert np.allclose(fit_e[:], fit)
+        assert np.allclose(pars_e[:], pars)
+        # The pool is not shut down
+        assert pool.submit(abs, -1).result() == 1
+
+
+def test_fit_pixels_executor_invalid():
+    signal = _recovery_signal('exp_recovery_2p', n=4)
+    with pytest.raises(ValueError):
+        mdreg.fit_pixels(signal, executor='dask', **_executor_kwargs())
+    if not fit_models.distributed_installed:
+        with pytest.raises(ImportError):
+            mdreg.fit_pixels(
+                signal, executor='distributed', **_executor_kwargs())
+
+
+if __name__ == "__main__":
+
+    for name in RECOVERY:
+        test_fit_pixels_batched(name, True)
+        test_fit_pixels_batched(name, False)
+        test_fit_exp_recovery_grid(name)
+    for i in range(4):
+        test_fit_fast(i)
+    test_fit_pixels_executor()
+    test_fit_pixels_executor_invalid()
+
+    print('All fit_models tests passed!!')
@@ -0,0 +1,188 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+import zarr
+
+import mdreg
+from mdreg import io
+
+
+@pytest.fixture(autouse=True)
+def zarr_options():
+    # Restore the default options after each test
+    yield
+    mdreg.set_zarr_options()
+
+
+def _zarr(array, chunks, path=None):
+    store = zarr.storage.MemoryStore() if path is None else path
+    zarray = zarr.create_array(
+        store=store, shape=array.shape, chunks=chunks, dtype=array.dtype)
+    zarray[:] = array
+    return zarray
+
+
+def test_set_zarr_options_invalid():
+    with pytest.raises(ValueError):
+        mdreg.set_zarr_options(compressor='gzip')
+    with pytest.raises(ValueError):
+        mdreg.set_zarr_options(layout='frames')
+
+
+def test_set_zarr_options():
+    signal = _zarr(np.ones((8, 6, 4, 5)), (8, 6, 1, 5))
+
+    # Defaults: same chunks and dtype as the input
+    fit, pars = io._fit_models_init(signal, None, 2)
+    assert fit.chunks == signal.chunks
+    assert pars.chunks == (8, 6, 1, 2)
+    assert fit.dtype == signal.dtype
+    defo = io._defo(signal, None)
+    assert defo.chunks == signal.chunks[:4] + (3,)
+
+    mdreg.set_zarr_options(dtype='float32', compressor=None, layout='auto')
+    fit, pars = io._fit_models_init(signal, None, 2)
+    assert fit.dtype == np.float32
+    assert fit.chunks[-1] == 5
+    assert pars.chunks[-1] == 2
+    assert fit.compressors == ()
+    coreg = io._copy(signal, None, 'coreg')
+    assert coreg.chunks == (8, 6, 4, 1)
+    assert np.array_equal(coreg[:], signal[:])
+    defo = io._defo(signal, None)
+    assert defo.chunks == (8, 6, 4, 1, 3)
+    assert defo.dtype == np.float32
+
+    mdreg.set_zarr_options(compressor='lz4')
+    fit, _ = io._fit_models_init(signal, None, 2)
+    assert fit.compressors[0].cname.value == 'lz4'
+
+    # Numpy arrays use the dtype option only
+    mdreg.set_zarr_options(dtype='float32')
+    fit, pars = io._fit_models_init(np.ones((8, 6, 5)), None, 2)
+    assert isinstance(fit, np.ndarray)
+    assert fit.dtype == np.float32
+
+
+def test_set_zarr_options_fit(tmp_path):
+    # The results of mdreg.fit do not depend on the options
+    rng = np.random.default_rng(0)
+    time = np.linspace(0, 0.1, 4)
+    moving = mdreg.exp_decay(
+        time, rng.uniform(100, 200, (16, 16, 2, 1)), 0.05)
+    moving += rng.random(moving.shape)
+    fit_pixels = {
+        'model': mdreg.exp_decay,
+        'xdata': time,
+        'func_init': mdreg.exp_decay_init,
+        'p0': [1, 0.05],
+        'bounds': ([0, 0], [np.inf, np.inf]),
+        'solver': 'batched',
+    }
+    results = []
+    for i, options in enumerate([
+            {},
+            {'compressor': 'lz4', 'layout': 'auto'},
+            {'compressor': None, 'dtype': 'float32'},
+        ]):
+        mdreg.set_zarr_options(**options)
+        path = os.path.join(tmp_path, str(i))
+        zmoving = _zarr(moving, (16, 16, 1, 4), os.path.join(path, 'in'))
+        coreg, fit, _, _ = mdreg.fit(
+            zmoving, fit_pixels=dict(fit_pixels), maxit=2, verbose=0, 
+            path=path,
+        )
+        results.append((coreg[:], fit[:]))
+    for coreg, fit in results[1:]:
+        assert np.allclose(coreg, results[0][0], rtol=1e-4)
+        assert np.allclose(fit, results[0][1], rtol=1e-4)
+
+
+def test_memmap(tmp_path):
+    array = io._memmap(tmp_path, 'a', (3, 4), np.float32)
+    assert isinstance(array, np.memmap)
+    assert np.array_equal(array, np.zeros((3, 4)))
+    array[...] = 1
+    array.flush()
+    # Existing files with the same shape and type are reused
+    assert np.array_equal(io._memmap(tmp_path, 'a', (3, 4), np.float32, 
+                                     zeros=False), array)
+    assert np.array_equal(io._memmap(tmp_path, 'a', (3, 4), np.float32), 
+                          np.zeros((3, 4)))
+    # and replaced otherwise
+    array = io._memmap(tmp_path, 'a', (2, 4), np.float64)
+    assert array.shape == (2, 4)
+    assert array.dtype == np.float64
+    assert np.load(os.path.join(tmp_path, 'a.npy')).shape == (2, 4)
+
+
+def test_move_memmap(tmp_path):
+    saved = io._save(np.ones((3, 4)), tmp_path, 'a')
+    assert isinstance(saved, np.memmap)
+    moved = io._move(saved, tmp_path, 'a')
+    assert not isinstance(moved, np.memmap)
+    # Later results written to the file do not change the moved array
+    io._save(np.zeros((3, 4)), tmp_path, 'a')
+    assert np.array_equal(moved, np.ones((3, 4)))
+    # Without a path nothing is copied
+    array = np.ones(3)
+    assert io._move(array, None, 'a') is array
+
+
+def test_fit_memmap(tmp_path):
+    # Numpy results computed on disk are the same as in memory
+    rng = np.random.default_rng(0)
+    time = np.linspace(0, 0.1, 4)
+    moving = mdreg.exp_decay(time, rng.uniform(100, 200, (16, 16, 1)), 0.05)
+    moving += rng.random(moving.shape)
+    fit_pixels = {
+        'model': mdreg.exp_decay,
+        'xdata': time,
+        'func_init': mdreg.exp_decay_init,
+        'p0': [1, 0.05],
+        'bounds': ([0, 0], [np.inf, np.inf]),
+        'solver': 'batched',
+    }
+    results = mdreg.fit(
+        moving, fit_pixels=dict(fit_pixels), maxit=2, verbose=0)
+    results_disk = mdreg.fit(
+        moving, fit_pixels=dict(fit_pixels), maxit=2, verbose=0, 
+        path=tmp_path)
+    names = ['coreg', 'fit', 'coreg_defo', 'pars']
+    for name, array, array_disk in zip(names, results, results_disk):
+        assert isinstance(array_disk, np.memmap)
+        assert np.allclose(array_disk, array, rtol=1e-12)
+        saved = np.load(os.path.join(tmp_path, name + '.npy'))
+        assert np.array_equal(saved, array_disk)
+
+
+def test_rechunk():
+    array = np.arange(2*3*4*5, dtype=float).reshape(2, 3, 4, 5)
+    source = _zarr(array, (2, 3, 4, 1))
+    target = io._rechunk_init(source, None, 'target', (2, 3, 1, 5))
+    io._rechunk(source, target)
+    assert np.array_equal(target[:], array)
+    # Only the selected frames are copied
+    source[...] = 0
+    io._rechunk(source, target, frames=[1, 3])
+    expected = array.copy()
+    expected[..., [1, 3]] = 0
+    assert np.array_equal(target[:], expected)
+
+
+if __name__ == "__main__":
+
+    test_set_zarr_options_invalid()
+    test_set_zarr_options()
+    mdreg.set_zarr_options()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_set_zarr_options_fit(tmp)
+    mdreg.set_zarr_options()
+    for test in [test_memmap, test_move_memmap, test_fit_memmap]:
+        with tempfile.TemporaryDirectory() as tmp:
+            test(tmp)
+    test_rechunk()
+
+    print('All io tests passed!!')
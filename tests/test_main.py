@@ -0,0 +1,94 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+import zarr
+
+import mdreg
+from mdreg import main
+
+
+def _exp_decay_series(seed=0):
+    rng = np.random.default_rng(seed)
+    time = np.linspace(0, 0.1, 4)
+    moving = mdreg.exp_decay(
+        time, rng.uniform(100, 200, (16, 16, 2, 1)), 0.05)
+    moving += rng.random(moving.shape)
+    fit_pixels = {
+        'model': mdreg.exp_decay,
+        'xdata': time,
+        'func_init': mdreg.exp_decay_init,
+        'p0': [1, 0.05],
+        'bounds': ([0, 0], [np.inf, np.inf]),
+        'solver': 'batched',
+    }
+    return moving, fit_pixels
+
+
+def _zarr(array, chunks, path=None):
+    store = zarr.storage.MemoryStore() if path is None else path
+    zarray = zarr.create_array(
+        store=store, shape=array.shape, chunks=chunks, dtype=array.dtype)
+    zarray[:] = array
+    return zarray
+
+
+def test_dual_layout_chunks():
+    coreg = _zarr(np.zeros((8, 6, 4, 5)), (8, 6, 4, 1))
+    assert main._dual_layout(coreg, False, 2) is None
+    assert main._dual_layout(coreg, True, 2) == (8, 6, 1, 5)
+    assert main._dual_layout(coreg, True, None) == (8, 6, 4, 5)
+    assert main._dual_layout(coreg, 'auto', 2) == (8, 6, 1, 5)
+    assert main._dual_layout(np.zeros((8, 6, 4, 5)), True, 2) is None
+    # No copy if the time curves are already in one chunk
+    coreg = _zarr(np.zeros((8, 6, 4, 5)), (8, 6, 1, 5))
+    assert main._dual_layout(coreg, True, 2) is None
+    # With 'auto' no copy if reading the time curves is cheap
+    coreg = _zarr(np.zeros((8, 6, 4, 5)), (8, 6, 1, 3))
+    assert main._dual_layout(coreg, True, 2) == (8, 6, 1, 5)
+    assert main._dual_layout(coreg, 'auto', 2) is None
+
+
+@pytest.mark.parametrize('memdim', [2, None])
+def test_fit_dual_layout(tmp_path, memdim):
+    moving, fit_pixels = _exp_decay_series()
+    fit_pixels['memdim'] = memdim
+    results = {}
+    for dual_layout in [False, True]:
+        path = os.path.join(tmp_path, str(dual_layout))
+        zmoving = _zarr(moving, (16, 16, 2, 1), os.path.join(path, 'in'))
+        coreg, fit, _, pars = mdreg.fit(
+            zmoving, fit_pixels=dict(fit_pixels), maxit=2, verbose=0, 
+            path=path, dual_layout=dual_layout,
+        )
+        results[dual_layout] = (coreg[:], fit[:], pars[:])
+        assert not os.path.exists(os.path.join(path, 'coreg_pixels.zarr'))
+    for a, b in zip(results[False], results[True]):
+        assert np.allclose(a, b, rtol=1e-12)
+
+
+def test_fit_dual_layout_invalid():
+    moving, fit_pixels = _exp_decay_series()
+    with pytest.raises(ValueError):
+        mdreg.fit(moving, fit_pixels=fit_pixels, dual_layout='always')
+
+
+def test_fit_parallel_slices_ants_in_memory():
+    moving = np.zeros((8, 8, 2, 3))
+    fit_coreg = {'package': 'ants', 'in_memory': True}
+    with pytest.raises(ValueError):
+        mdreg.fit(moving, fit_coreg=fit_coreg, force_2d=True, 
+                  parallel_slices=True)
+
+
+if __name__ == "__main__":
+
+    test_fit_parallel_slices_ants_in_memory()
+    test_dual_layout_chunks()
+    for memdim in [2, None]:
+        with tempfile.TemporaryDirectory() as tmp:
+            test_fit_dual_layout(tmp, memdim)
+    test_fit_dual_layout_invalid()
+
+    print('All main tests passed!!')
@@ -0,0 +1,41 @@
+import numpy as np
+
+from mdreg import pixel_models
+
+
+def test_spgr_vfa_degenerate_pixel():
+    # A pixel with E = 1 is degenerate at FA = 0 only, and does not 
+    # change the model or the Jacobian of the other pixels.
+    FA = np.array([0, 2, 5, 10, 15, 20])
+    S0 = np.array([[100], [200]])
+    E = np.array([[0.9], [1.0]])
+    signal = pixel_models.spgr_vfa(FA, S0, E)
+    jac = pixel_models.spgr_vfa_jac(FA, S0, E)
+    assert np.allclose(signal[0], pixel_models.spgr_vfa(FA, 100, 0.9))
+    assert np.allclose(jac[0], pixel_models.spgr_vfa_jac(FA, 100, 0.9))
+    assert np.all(np.isfinite(jac))
+    assert np.array_equal(signal[1], np.zeros(6))
+    h = 1e-6
+    dE = pixel_models.spgr_vfa(FA[1:], 200, 1) - pixel_models.spgr_vfa(
+        FA[1:], 200, 1 - h)
+    assert np.allclose(jac[1,1:,1], dE / h, rtol=1e-2)
+
+
+def test_spgr_vfa_jac():
+    FA = np.array([2, 5, 10, 15, 20])
+    h = 1e-6
+    jac = pixel_models.spgr_vfa_jac(FA, 100, 0.9)
+    dS0 = pixel_models.spgr_vfa(FA, 100 + h, 0.9) - pixel_models.spgr_vfa(
+        FA, 100 - h, 0.9)
+    dE = pixel_models.spgr_vfa(FA, 100, 0.9 + h) - pixel_models.spgr_vfa(
+        FA, 100, 0.9 - h)
+    assert np.allclose(jac[:,0], dS0 / (2*h), rtol=1e-5)
+    assert np.allclose(jac[:,1], dE / (2*h), rtol=1e-5)
+
+
+if __name__ == "__main__":
+
+    test_spgr_vfa_degenerate_pixel()
+    test_spgr_vfa_jac()
+
+    print('All pixel_models tests passed!!')
@@ -0,0 +1,75 @@
+import numpy as np
+import zarr
+
+import mdreg
+
+
+def _field(d, component, axis, slope, n=16):
+    # Deformation field with u[component] = slope * x[axis]
+    shape = (n, n, n if d == 3 else 1, 1, d)
+    defo = np.zeros(shape)
+    x = np.arange(shape[axis], dtype=float)
+    x = x.reshape([-1 if i == axis else 1 for i in range(4)])
+    defo[..., component] = slope * x
+    return defo
+
+
+def test_defo_folding_2d():
+    # Shear: det = 1, no folding
+    defo = _field(2, 0, 1, -1.5)
+    assert np.array_equal(mdreg.defo_folding(defo), [0])
+    # Compression: det = 0.5, no folding
+    defo = _field(2, 0, 0, -0.5)
+    assert np.array_equal(mdreg.defo_folding(defo), [0])
+    # Fold: det = -0.5 everywhere
+    defo = _field(2, 0, 0, -1.5)
+    assert np.array_equal(mdreg.defo_folding(defo), [1])
+    defo = _field(2, 1, 1, -1.5)
+    assert np.array_equal(mdreg.defo_folding(defo), [1])
+
+
+def test_defo_folding_3d():
+    defo = _field(3, 0, 2, -1.5)
+    assert np.array_equal(mdreg.defo_folding(defo), [0])
+    defo = _field(3, 2, 2, -0.5)
+    assert np.array_equal(mdreg.defo_folding(defo), [0])
+    defo = _field(3, 2, 2, -1.5)
+    assert np.array_equal(mdreg.defo_folding(defo), [1])
+
+
+def test_defo_folding_zarr():
+    # Partial fold in one of two frames, processed chunk by chunk
+    defo = np.concatenate(
+        [_field(2, 0, 0, -0.5), _field(2, 0, 0, -1.5)], axis=3)
+    defo[8:,...,1,:] = 0
+    zdefo = zarr.create_array(
+        store=zarr.storage.MemoryStore(), shape=defo.shape,
+        chunks=(5, 5, 1, 1, 2), dtype=defo.dtype,
+    )
+    zdefo[:] = defo
+    folding = mdreg.defo_folding(defo)
+    assert 0 < folding[1] < 1
+    assert folding[0] == 0
+    assert np.array_equal(mdreg.defo_folding(zdefo), folding)
+
+
+def test_defo_jacobian():
+    defo = _field(3, 0, 1, 0.5) + _field(3, 2, 2, -0.5)
+    jac_mat, jac_det = mdreg.defo_jacobian_3d(defo)
+    assert np.allclose(jac_mat[...,0,1], 0.5)
+    assert np.allclose(jac_mat[...,2,2], 0.5)
+    assert np.allclose(jac_det, 0.5)
+    assert np.allclose(jac_det, np.linalg.det(jac_mat))
+    zdefo = zarr.array(defo, chunks=(5, 5, 5, 1, 3))
+    jac_det_z = mdreg.defo_jacobian_3d(zdefo, return_matrix=False)
+    assert np.allclose(jac_det_z[:], jac_det)
+
+
+if __name__ == "__main__":
+
+    test_defo_folding_2d()
+    test_defo_folding_3d()
+    test_defo_folding_zarr()
+    test_defo_jacobian()
+
+    print('All utils tests passed!!')